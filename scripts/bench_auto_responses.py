@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compare a naive loop over every trigger with the compiled auto-response matcher.
+
+  Usage:
+    `python3 ./scripts/bench_auto_responses.py [n_triggers] [n_messages]`
+
+Triggers and messages are random French-like words, with accents and upper case letters.
+Messages are drawn from a vocabulary of 5000 words, as chats keep repeating the same words.
+The fuzzy matcher uses the same triggers with `fuzzy` set, to also match the words a typo away
+from a trigger : its results differ. It runs twice, the second (warm) run with the verdict of
+every word already cached.
+"""
+
+import dataclasses
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.getcwd())
+
+from src.events import AutoResponseData, AutoResponseMatcher, fold # pylint: disable=wrong-import-position
+
+SYLLABLES = ['ba', 'bé', 'cha', 'dé', 'fê', 'gi', 'jo', 'la', 'mè', 'no', 'pou', 'ré', 'sa', 'té', 'vi', 'zo']
+
+
+def word() -> str:
+  return ''.join(random.choices(SYLLABLES, k=random.randint(2, 4)))
+
+
+def naive_match(rules: list[tuple[AutoResponseData, list[str]]], content: str) -> list[AutoResponseData]:
+  """Every (already folded) trigger is looked for in every message"""
+  words = fold(content).split()
+  return [rule for rule, triggers in rules if any(trigger in words for trigger in triggers)]
+
+
+def main(n_triggers: int, n_messages: int) -> None:
+  random.seed(0)
+  rules = [AutoResponseData(triggers=[word()], answer='!') for _ in range(n_triggers)]
+  vocabulary = [word() for _ in range(5000)]
+  messages = [' '.join(random.choice(vocabulary).capitalize() for _ in range(20)) for _ in range(n_messages)]
+
+  start = time.perf_counter()
+  matcher = AutoResponseMatcher(rules)
+  print(f'{n_triggers} triggers compiled in {(time.perf_counter() - start) * 1000:.1f}ms, '
+        f'{n_messages} messages of 20 words')
+  folded = [(rule, [fold(trigger) for trigger in rule.triggers]) for rule in rules]
+  fuzzy = AutoResponseMatcher(dataclasses.replace(rule, fuzzy=True) for rule in rules)
+  results = []
+  for name, match in (
+    ('naive', lambda m: naive_match(folded, m)),
+    ('compiled', matcher.match),
+    ('fuzzy', fuzzy.match),
+    ('warm', fuzzy.match),
+  ):
+    start = time.perf_counter()
+    results.append([match(m) for m in messages])
+    print(f'{name:>9} : {(time.perf_counter() - start) / n_messages * 1e6:8.1f}µs per message')
+  assert [[id(r) for r in hits] for hits in results[0]] == [[id(r) for r in hits] for hits in results[1]]
+  n_more = sum(len(hits) for hits in results[2]) - sum(len(hits) for hits in results[1])
+  print(f'fuzzy matching found {n_more} more auto-responses')
+
+
+if __name__ == '__main__':
+  main(
+    int(sys.argv[1]) if len(sys.argv) > 1 else 1000,
+    int(sys.argv[2]) if len(sys.argv) > 2 else 1000,
+  )
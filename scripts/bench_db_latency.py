@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Measure the event loop lag caused by database calls under a simulated latency.
+
+  Usage:
+    `python3 ./scripts/bench_db_latency.py [latency_ms] [n_calls]`
+
+A heartbeat coroutine ticks every 10ms while a burst of concurrent
+`get_user_xp` calls is processed, first by calling the blocking backend
+inline (as the bot used to do), then through the awaitable worker pool.
+The reported lag is how late the heartbeat woke up.
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.getcwd())
+
+from src.db import SqliteBackend, UsefulDatabase # pylint: disable=wrong-import-position
+
+TICK = 0.01
+
+
+class SlowBackend(SqliteBackend):
+  """
+  An in-memory backend whose lookups take `latency` more seconds, like a remote round trip.
+  """
+
+  def __init__(self, latency: float) -> None:
+    super().__init__(':memory:')
+    self.latency = latency
+
+  def get_user_xp(self, guild_id: int, user_id: int) -> int:
+    time.sleep(self.latency)
+    return super().get_user_xp(guild_id, user_id)
+
+
+async def heartbeat(lags: list[float], stop: asyncio.Event) -> None:
+  while not stop.is_set():
+    before = time.perf_counter()
+    await asyncio.sleep(TICK)
+    lags.append(time.perf_counter() - before - TICK)
+
+
+async def measure(db: UsefulDatabase, n_calls: int, blocking: bool) -> tuple[float, float, float]:
+  lags: list[float] = []
+  stop = asyncio.Event()
+  beat = asyncio.create_task(heartbeat(lags, stop))
+  await asyncio.sleep(0)
+
+  async def blocking_call(user_id: int) -> int:
+    return db.backend.get_user_xp(0, user_id)
+
+  async def pooled_call(user_id: int) -> int:
+    return await db.get_user_xp(0, user_id)
+
+  call = blocking_call if blocking else pooled_call
+  start = time.perf_counter()
+  await asyncio.gather(*(call(i) for i in range(n_calls)))
+  elapsed = time.perf_counter() - start
+
+  stop.set()
+  await beat
+  lags.sort()
+  return elapsed, lags[-1], lags[len(lags) // 2]
+
+
+async def main(latency_ms: float, n_calls: int) -> None:
+  db = UsefulDatabase(SlowBackend(latency_ms / 1000))
+  db.connect()
+  print(f'{n_calls} calls at {latency_ms:.0f}ms simulated latency, {db.executor._max_workers} workers')
+  for name, blocking in (('before (inline)', True), ('after (pool)', False)):
+    elapsed, worst, median = await measure(db, n_calls, blocking)
+    print(f'{name:>16} : total {elapsed * 1000:8.1f}ms | '
+          f'loop lag max {worst * 1000:8.1f}ms median {median * 1000:6.1f}ms')
+
+
+if __name__ == '__main__':
+  asyncio.run(
+    main(
+      float(sys.argv[1]) if len(sys.argv) > 1 else 50.0,
+      int(sys.argv[2]) if len(sys.argv) > 2 else 20,
+    ))
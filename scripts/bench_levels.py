@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compare the xp to level conversions : the former linear loop, the bisect lookup and the batched variant.
+
+  Usage:
+    `python3 ./scripts/bench_levels.py [n_values]`
+
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.getcwd())
+
+from src.helper.levels import MAX_LVL, lvl_to_xp, xp_to_lvl, xp_to_lvls # pylint: disable=wrong-import-position
+
+
+def loop_xp_to_lvl(xp: int) -> int:
+  """The conversion as it was done before the threshold table"""
+  if xp < lvl_to_xp(1):
+    return 0
+  for i in range(1, MAX_LVL):
+    if lvl_to_xp(i) <= xp < lvl_to_xp(i + 1):
+      return i
+  return MAX_LVL
+
+
+def main(n_values: int) -> None:
+  xps = [random.randrange(0, lvl_to_xp(MAX_LVL) + 1000) for _ in range(n_values)]
+  print(f'{n_values} xp totals')
+  results = []
+  for name, convert in (
+    ('loop', lambda: [loop_xp_to_lvl(xp) for xp in xps]),
+    ('bisect', lambda: [xp_to_lvl(xp) for xp in xps]),
+    ('batch', lambda: xp_to_lvls(xps)),
+  ):
+    start = time.perf_counter()
+    results.append(convert())
+    print(f'{name:>8} : {(time.perf_counter() - start) * 1000:8.1f}ms')
+  assert results[0] == results[1] == results[2]
+
+
+if __name__ == '__main__':
+  main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Measure the time and peak memory of a full guild scan, one object per member vs parallel arrays.
+
+  Usage:
+    `python3 ./scripts/bench_user_scan.py [n_users] [batch_size]`
+
+The members are stored in an in-memory SQLite database, peak memory is traced with `tracemalloc`.
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.getcwd())
+
+from src.db import SqliteBackend # pylint: disable=wrong-import-position
+
+GUILD = 1
+
+
+def measure(scan) -> tuple[float, int, int]:
+  tracemalloc.start()
+  start = time.perf_counter()
+  result = scan()
+  elapsed = time.perf_counter() - start
+  _, peak = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+  return elapsed, peak, len(result)
+
+
+def main(n_users: int, batch_size: int) -> None:
+  backend = SqliteBackend(':memory:')
+  backend.connect()
+  backend.bulk_add_xp({(GUILD, user_id): ('', user_id % 5000) for user_id in range(n_users)})
+  print(f'{n_users} members, batches of {batch_size}')
+  for name, scan in (
+    ('entries', lambda: backend.users(GUILD, batch_size)),
+    ('columns', lambda: backend.user_columns(GUILD, batch_size)),
+  ):
+    elapsed, peak, n = measure(scan)
+    print(f'{name:>8} : {n} rows in {elapsed * 1000:7.1f}ms | peak {peak / 2**20:6.2f}MiB')
+
+
+if __name__ == '__main__':
+  main(
+    int(sys.argv[1]) if len(sys.argv) > 1 else 100_000,
+    int(sys.argv[2]) if len(sys.argv) > 2 else 1000,
+  )
@@ -1,3 +1,5 @@
+import itertools
+import math
 from collections.abc import Callable
 
 import discord
@@ -10,8 +12,17 @@ from ..messages import CustomView
 
 __all__ = ['Xp']
 
+PERIOD_NAMES = {Period.ALL: 'all time', Period.WEEK: 'last 7 days', Period.MONTH: 'last 30 days'}
+
 
 class LeaderBoardView(CustomView):
+  """
+  ## Description
+  Paginated leaderboard of a guild.\\
+  Pages are read from the shared leaderboard snapshot of the guild and rendered only when
+  shown ; rendered pages are kept in the snapshot for the other views showing it. The names
+  of a page are resolved together by the `MemberResolver`.
+  """
 
   items_per_page = 10
 
@@ -20,7 +31,10 @@ class LeaderBoardView(CustomView):
     orig_inter: discord.Integration,
     embed: discord.Embed,
     client: commands.AutoShardedBot,
-    db: UsefulDatabase,
+    snapshots: LeaderboardSnapshots,
+    members: MemberResolver,
+    *,
+    period: Period = Period.ALL,
     timeout: int | None = 180,
   ):
     super().__init__(orig_inter, timeout)
@@ -29,55 +43,47 @@ class LeaderBoardView(CustomView):
     self.with_button_callback("➡️", callback=self.__on_page_change(1))
 
     self.embed = embed
-    self.items: dict[int, str] = {}
-
-    self.__tmp_records: list[ExportUserEntry] = None
     self.client = client
-    self.__db = db
+    self.__snapshots = snapshots
+    self.__members = members
+    self.period = period
+    self.__snapshot: LeaderboardSnapshot = None
     self.__page = 0
 
-    self.__setup()
-
-  @property
-  def first_page(self) -> str:
-    return self.items[0]
-
   @property
   def n_pages(self) -> int:
-    return len(self.items)
+    return max(1, math.ceil(len(self.__snapshot) / self.items_per_page))
 
   def wrap_page_no(self, page: int) -> int:
     return page % self.n_pages
 
-  def __setup(self) -> None:
-    self.__tmp_records = sorted(self.__db.users(), key=lambda e: e.xp, reverse=True)
-
-    building_page = 0
-    current_page = ''
-    i = 0
-    for entry in self.__tmp_records:
-      user = self.interaction.guild.get_member(entry.id)
-      xp = entry.xp
-      if user is None or xp < 0:
-        continue
-      i += 1
-      line = f'{i}. `{user.display_name}` ({user.mention}) {xp} XP ({self.client.xp_to_lvl(xp)})\n'
-      current_page += line
-
-      if i % self.items_per_page == 0:
-        self.items.update({building_page: current_page})
-        current_page = ''
-        building_page += 1
-
-    if current_page != '':
-      self.items.update({building_page: current_page})
+  async def setup(self) -> 'LeaderBoardView':
+    self.__snapshot = await self.__snapshots.get(self.interaction.guild.id, self.period)
+    return self
+
+  async def page(self, page: int) -> str:
+    """Returns a rendered page, rendering it if no view did yet"""
+    if (text := self.__snapshot.pages.get(page)) is None:
+      text = self.__snapshot.pages[page] = await self.__render(page)
+    return text
+
+  async def __render(self, page: int) -> str:
+    start = page * self.items_per_page
+    entries = self.__snapshot.page(start, self.items_per_page) # already sorted by decreasing XP
+    names = await self.__members.display_names(self.interaction.guild, (e.id for e in entries))
+    lines = []
+    for rank, entry, lvl in zip(itertools.count(start + 1), entries, xp_to_lvls(e.xp for e in entries)):
+      name = f'`{names[entry.id]}` (<@{entry.id}>)' if entry.id in names else f'<@{entry.id}>'
+                                                               # the XP of a period is not a level : only the lifetime leaderboard shows one
+      lines.append(f'{rank}. {name} {entry.xp} XP' + (f' ({lvl})' if self.period is Period.ALL else ''))
+    return '\n'.join(lines) if lines else 'Nobody has any XP yet.'
 
   def __on_page_change(self, page: int) -> Callable[[discord.Interaction], None]:
 
     async def callback(interaction: discord.Interaction) -> None:
       self.__page = self.wrap_page_no(self.__page + page)
 
-      self.embed.description = self.items[self.__page]
+      self.embed.description = await self.page(self.__page)
       self.embed.set_footer(text=f'Page {self.__page + 1}/{self.n_pages}')
 
       await self.interaction.edit_original_response(embed=self.embed, view=self)
@@ -90,6 +96,8 @@ class Xp(UsefullCog):
 
   def __init__(self, client: commands.AutoShardedBot, db: UsefulDatabase):
     self.__db = db
+    self.__snapshots = LeaderboardSnapshots(db)
+    self.__members = MemberResolver()
     super().__init__(client)
 
   @app_commands.command(name='help', description='Get help about a command')
@@ -105,14 +113,23 @@ class Xp(UsefullCog):
       name='👤 `user`',
       value='Get the XP of a user in the server (public mode).',
       inline=False,
+    ).add_field(
+      name='🏅 `rank`',
+      value='Get the rank of a user in the server and the XP left to reach the next one.',
+      inline=False,
     ).add_field(
       name='📊 `leaderboard`',
-      value='Get the XP leaderboard of the server.',
+      value='Get the XP leaderboard of the server, of all time or of the last 7 or 30 days.',
       inline=False,
     ).add_field(
       name='📊 `no_life`',
       value='Alias to top 3 of `leaderboard`.',
       inline=False,
+    ).add_field(
+      name='🗃️ `migrate`',
+      value=
+      'Split the XP stored before it was tracked per server between the servers of its users (admin only).',
+      inline=False,
     )
     await self.dispatcher.reply_with_embed(interaction, embed)
     self.log_interaction(interaction)
@@ -120,7 +137,7 @@ class Xp(UsefullCog):
   @app_commands.command(name='me', description='Get your XP in the server 🕵️')
   async def me(self, interaction: discord.Interaction):
     user = interaction.user
-    xp = self.__db.get_user_xp(user.id)
+    xp = await self.__db.get_user_xp(interaction.guild.id, user.id)
     failed = False
     embed = self.embed_builder.build_info_embed(
       title=f'Your XP in {interaction.guild.name}',
@@ -138,7 +155,7 @@ class Xp(UsefullCog):
   async def user(self, interaction: discord.Interaction, user: discord.Member | None = None):
     if not user:
       user = interaction.user
-    xp = self.__db.get_user_xp(user.id)
+    xp = await self.__db.get_user_xp(interaction.guild.id, user.id)
     embed = self.embed_builder.build_info_embed(
       title=f'XP of {user.display_name} in {interaction.guild.name}',
       description=f'{user.display_name} ({user.mention}) : {xp} XP ({self.client.xp_to_lvl(xp)})',
@@ -151,20 +168,57 @@ class Xp(UsefullCog):
     await self.dispatcher.reply_with_embed(interaction, embed)
     self.log_interaction(interaction)
 
+  @app_commands.command(name='rank', description='Get the rank of a user in the server 🏅')
+  async def rank(self, interaction: discord.Interaction, user: discord.Member | None = None):
+    if not user:
+      user = interaction.user
+    if (user_rank := await self.__db.user_rank(interaction.guild.id, user.id)) is None:
+      embed = self.embed_builder.build_error_embed(
+        title=f'{user.display_name} does not have any XP in {interaction.guild.name}',
+        description='Send a few messages to enter the leaderboard.',
+      )
+      await self.dispatcher.reply_with_status_embed(interaction, embed, failed=True)
+      self.log_interaction(interaction)
+      return
+
+    description = f'{user.display_name} ({user.mention}) : #{user_rank.rank}/{user_rank.total}, '\
+                  f'{user_rank.xp} XP ({self.client.xp_to_lvl(user_rank.xp)})'
+    if user_rank.above is None:
+      description += '\nFirst of the server 🏆'
+    else:
+      description += f'\n{user_rank.gap} XP behind <@{user_rank.above.id}> (#{user_rank.rank - 1})'
+    embed = self.embed_builder.build_info_embed(
+      title=f'Rank of {user.display_name} in {interaction.guild.name}',
+      description=description,
+    )
+    await self.dispatcher.reply_with_embed(interaction, embed)
+    self.log_interaction(interaction)
+
   @app_commands.command(name='leaderboard', description='Get the XP leaderboard of the server 📊')
-  async def leaderboard(self, interaction: discord.Interaction):
+  @app_commands.describe(period='Only count the XP earned during this period (defaults to all time)')
+  @app_commands.choices(
+    period=[app_commands.Choice(name=name, value=period.value) for period, name in PERIOD_NAMES.items()])
+  async def leaderboard(self,
+                        interaction: discord.Interaction,
+                        period: app_commands.Choice[int] | None = None):
     embed: discord.Embed = None
     view: LeaderBoardView = None
+    period = Period(period.value) if period is not None else Period.ALL
 
+    title = f'📊 Leaderboard of {interaction.guild.name}'
     embed = self.embed_builder.build_info_embed(
-      title=f'📊 Leaderboard of {interaction.guild.name}',
+      title=title if period is Period.ALL else f'{title} ({PERIOD_NAMES[period]})',
       description='...loading...',
     )
-    view = LeaderBoardView(interaction, embed, self.client, self.__db)
+    view = await LeaderBoardView(interaction,
+                                 embed,
+                                 self.client,
+                                 self.__snapshots,
+                                 self.__members,
+                                 period=period).setup()
     await self.dispatcher.send_xp_embed(interaction, embed, view)
 
-    first_page = view.first_page
-    embed.description = first_page
+    embed.description = await view.page(0)
     embed.set_footer(text=f'Page 1/{view.n_pages}')
     await interaction.edit_original_response(embed=embed, view=view)
     self.log_interaction(interaction)
@@ -177,15 +231,43 @@ class Xp(UsefullCog):
       description=':flag_fr: les pires no-lifes du serveur :flag_fr:',
     )
     # do not change the "3" 🥲
-    for i, user_entry in enumerate(self.__db.top_users(3)):
-      user = interaction.guild.get_member(user_entry.id)
+    top_users = await self.__db.top_users(interaction.guild.id, 3)
+    names = await self.__members.display_names(interaction.guild, (e.id for e in top_users))
+    for i, user_entry in enumerate(top_users):
+      name = f'`{names[user_entry.id]}` (<@{user_entry.id}>)' if user_entry.id in names else f'<@{user_entry.id}>'
       xp = user_entry.xp
       embed.add_field(
         name='',
-        value=
-        f'{TROPHY_EMOJIS[i]} `{user.display_name}` ({user.mention}) {xp} XP ({self.client.xp_to_lvl(xp)})',
+        value=f'{TROPHY_EMOJIS[i]} {name} {xp} XP ({self.client.xp_to_lvl(xp)})',
         inline=False,
       )
 
     await self.dispatcher.reply_with_embed(interaction, embed)
     self.log_interaction(interaction)
+
+  @app_commands.command(name='migrate', description='Split legacy XP between servers 🗃️')
+  @app_commands.checks.has_permissions(administrator=True)
+  async def migrate(self, interaction: discord.Interaction):
+    embed = self.embed_builder.build_info_embed(
+      title='Migrating legacy XP...',
+      description='...loading...',
+    )
+    await self.dispatcher.reply_with_embed(interaction, embed)
+
+    # every legacy user gets its XP in each guild it is (still) a member of
+    legacy_ids = await self.__db.legacy_user_ids()
+    assignments: dict[int, list[int]] = {}
+    for user_id in legacy_ids:
+      if guild_ids := [guild.id for guild in self.client.guilds if guild.get_member(user_id) is not None]:
+        assignments[user_id] = guild_ids
+
+    async with self.client.xp_buffer.paused(): # live increments wait for the migration
+      n = await self.__db.migrate_legacy_users(assignments)
+
+    embed = self.embed_builder.build_success_embed(
+      title=f'{SUCCESS_EMOJI} legacy XP migrated !',
+      description=
+      f'```{n}/{len(legacy_ids)} users migrated, {len(legacy_ids) - n} left (not in any server)```',
+    )
+    await self.dispatcher.edit_reply_with_embed(interaction, embed)
+    self.log_interaction(interaction)
@@ -0,0 +1,154 @@
+import os
+
+import asyncio
+import datetime
+import logging
+from collections.abc import Callable, Iterable
+
+import discord
+from discord.message import Message
+
+from ..db import XpBuffer, xp_day
+
+from .checkpoints import ChannelToLastMessageInfo
+
+__all__ = ['HistoryBackfill']
+
+XP_BACKFILL = os.getenv('XP_BACKFILL', 'False').lower() in {'true', '1', 'yes'}
+BACKFILL_CONCURRENCY = int(os.getenv('BACKFILL_CONCURRENCY', '4'))
+BACKFILL_BATCH = int(os.getenv('BACKFILL_BATCH', '1000'))
+BACKFILL_MAX_AGE = float(os.getenv('BACKFILL_MAX_AGE', '30')) # days, 0 for no limit
+
+
+class HistoryBackfill:
+  """
+  ## Description
+  Crawls channel histories to give the XP of the messages sent while the bot was offline.\\
+  At most `concurrency` channels are crawled at once. Each channel is read oldest first from
+  its checkpoint up to the start of the crawl (later messages are processed live) ; every
+  `batch_size` messages the XP is written in bulk, in the daily buckets of the days it was
+  earned, then the checkpoint is moved and saved, so an interrupted crawl resumes from its
+  last batch. A channel without checkpoint is only crawled from `max_age` days ago (0 for its
+  whole history).
+
+  Messages processed live must be checkpointed through `track`. From `hold` (called before
+  live messages are processed) until its crawl ends, the live checkpoint of a channel is held
+  back so that it cannot jump over the history that remains to be crawled ; the crawl then
+  stops where live processing started. When a crawl fails, the held checkpoint is still saved :
+  the rest of its history is skipped rather than live messages scored twice on the next start.
+  """
+
+  def __init__(
+    self,
+    checkpoints: ChannelToLastMessageInfo,
+    xp_buffer: XpBuffer,
+    score: Callable[[Message], int],
+    concurrency: int = BACKFILL_CONCURRENCY,
+    batch_size: int = BACKFILL_BATCH,
+    *,
+    max_age: float = BACKFILL_MAX_AGE,
+  ):
+    self.checkpoints = checkpoints
+    self.xp_buffer = xp_buffer
+    self.score = score
+    self.batch_size = batch_size
+    self.max_age = max_age
+    self.__semaphore = asyncio.Semaphore(max(1, concurrency))
+    self.__until: discord.Object | None = None # start of live processing, while holding
+    self.__crawled: set[int] = set()           # channels whose checkpoint is no longer held
+                                               # channel id -> latest live message, for the channels not crawled yet
+    self.__held: dict[int, Message] = {}
+
+    self.log = logging.getLogger('resistance.backfill')
+
+  @staticmethod
+  def readable_channels(guilds: Iterable[discord.Guild]) -> list[discord.TextChannel]:
+    """Returns the text channels whose history the bot can read"""
+    return [
+      channel for guild in guilds for channel in guild.text_channels
+      if channel.permissions_for(guild.me).read_message_history
+    ]
+
+  def hold(self) -> None:
+    """Holds back the live checkpoints from now on, until `run` crawled the history up to now"""
+    if self.__until is None:
+      self.__until = discord.Object(id=discord.utils.time_snowflake(discord.utils.utcnow()))
+
+  def track(self, message: Message) -> None:
+    """Checkpoints a message processed live"""
+    if self.__until is None or message.channel.id in self.__crawled:
+      self.checkpoints.update(message.channel.id, message.id, message.created_at.timestamp())
+    elif (held := self.__held.get(message.channel.id)) is None or message.id > held.id:
+      self.__held[message.channel.id] = message
+
+  def __release(self, channel_id: int) -> None:
+    self.__crawled.add(channel_id)
+    if (held := self.__held.pop(channel_id, None)) is not None:
+      self.checkpoints.update(channel_id, held.id, held.created_at.timestamp())
+
+  async def run(self, channels: Iterable[discord.TextChannel]) -> int:
+    """Crawls every channel and returns the number of scored messages"""
+    channels = list(channels)
+    self.hold()
+    until = self.__until
+    now = discord.utils.snowflake_time(until.id)
+    oldest = None
+    if self.max_age > 0:
+      oldest = discord.Object(id=discord.utils.time_snowflake(now - datetime.timedelta(days=self.max_age)))
+    self.log.info('Backfilling XP...')
+    results = await asyncio.gather(*(self.__crawl(channel, oldest, until) for channel in channels),
+                                   return_exceptions=True)
+    n = 0
+    for channel, result in zip(channels, results):
+      if isinstance(result, BaseException):
+        self.log.error('Could not backfill channel %d: %s', channel.id, result)
+      else:
+        n += result
+    for channel_id in list(self.__held): # channels left out of the crawl
+      self.__release(channel_id)
+    self.__until = None
+    self.__crawled.clear()
+    await self.checkpoints.flush()
+    self.log.info('Backfilled XP of %d messages', n)
+    return n
+
+  async def __crawl(self, channel: discord.TextChannel, oldest: discord.Object | None,
+                    until: discord.Object) -> int:
+    try:
+      n = await self.__crawl_history(channel, oldest, until)
+    finally:
+      self.__release(channel.id) # also on failure : live messages must not be crawled again
+    await self.checkpoints.flush()
+    return n
+
+  async def __crawl_history(self, channel: discord.TextChannel, oldest: discord.Object | None,
+                            until: discord.Object) -> int:
+    async with self.__semaphore:
+      last_id = self.checkpoints.last_message_id(channel.id)
+      after = discord.Object(id=last_id) if last_id is not None else oldest
+      deltas: dict[int, dict[tuple[int, int], tuple[str, int]]] = {} # day -> deltas
+      n = 0
+      last: Message | None = None
+      async for message in channel.history(limit=None, after=after, before=until, oldest_first=True):
+        last = message
+        n += 1
+        if not message.author.bot and (xp := self.score(message)) > 0:
+          day_deltas = deltas.setdefault(xp_day(message.created_at.timestamp()), {})
+          _, amount = day_deltas.get(key := (channel.guild.id, message.author.id), (message.author.name, 0))
+          day_deltas[key] = (message.author.name, amount + xp)
+        if n % self.batch_size == 0:
+          await self.__commit(channel, deltas, last)
+          deltas = {}
+      if last is not None:
+        await self.__commit(channel, deltas, last)
+      return n
+
+  async def __commit(self, channel: discord.TextChannel,
+                     deltas: dict[int, dict[tuple[int, int], tuple[str, int]]], last: Message) -> None:
+    # XP first : a crash in between re-scores this batch rather than losing it
+    if deltas:
+      for day, day_deltas in sorted(deltas.items()):
+        await self.xp_buffer.add_many(day_deltas, day)
+      await self.xp_buffer.flush()
+    self.checkpoints.update(channel.id, last.id, last.created_at.timestamp())
+    await self.checkpoints.flush()
@@ -0,0 +1,195 @@
+import os
+
+import asyncio
+import logging
+import threading
+import time
+
+from pyjson5 import decode_io # pylint: disable=no-name-in-module
+
+__all__ = ['ChannelToLastMessageInfo']
+
+CHECKPOINT_FLUSH_INTERVAL = float(os.getenv('CHECKPOINT_FLUSH_INTERVAL', '10'))
+CHECKPOINT_FLUSH_SIZE = int(os.getenv('CHECKPOINT_FLUSH_SIZE', '256'))
+
+
+class ChannelToLastMessageInfo:
+  """
+  ## Description
+  The last message processed in each channel (`channel_id -> (message_id, timestamp)`),
+  used to resume the history backfill where it stopped.
+
+  Checkpoints are stored in an append-only log of `channel_id message_id timestamp` lines,
+  the last line of a channel winning. Updates are kept in memory and appended in batches,
+  with a single fsync, every `flush_interval` seconds or `flush_size` channels ; from the event
+  loop, batches are written by a background task, their fsync running in a thread. Once the
+  log holds more than twice as many lines as channels, it is compacted to one line per channel
+  in a temporary file atomically renamed over the log. The blocking `save` of a shutdown waits
+  for the write of a background batch, and writes the channels of a batch not written yet itself.
+  """
+
+  file_path = 'data/last_message.log'
+  legacy_file_path = 'data/last_message.json5' # read once when there is no log yet
+
+  def __init__(self,
+               flush_interval: float = CHECKPOINT_FLUSH_INTERVAL,
+               flush_size: int = CHECKPOINT_FLUSH_SIZE):
+    os.makedirs(os.path.dirname(self.file_path) or '.', exist_ok=True)
+    self.data: dict[int, tuple[int, float]] = {}
+    self.flush_interval = flush_interval
+    self.flush_size = flush_size
+    self.__dirty: set[int] = set()
+    self.__n_lines = 0
+    self.__last_flush = time.monotonic()
+    self.__flushing: asyncio.Task | None = None
+    self.__lock = asyncio.Lock()        # one batch written at a time, in order
+    self.__file_lock = threading.Lock() # between the background writes and a blocking save
+    self.__n_taken = 0
+    self.__unwritten: set[int] = set()  # channels of the batch taken by `flush`, not written yet
+
+    self.log = logging.getLogger('resistance.checkpoints')
+    self.__load()
+
+  def __load(self) -> None:
+    try:
+      n_invalid = 0
+      with open(self.file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+          # a torn last line is a write interrupted by a crash, never acknowledged
+          if (entry := self.__parse(line)) is None:
+            n_invalid += 1
+            continue
+          channel_id, message_id, timestamp = entry
+          self.data[channel_id] = (message_id, timestamp)
+          self.__n_lines += 1
+      if n_invalid: # rewritten, or the next append would be glued to a torn line
+        self.log.warning('Skipped %d invalid lines of %s', n_invalid, self.file_path)
+        self.compact()
+      return
+    except FileNotFoundError:
+      pass
+
+    try:
+      with open(self.legacy_file_path, 'r', encoding='utf-8') as f:
+        legacy = decode_io(f)
+    except FileNotFoundError:
+      return
+    self.data = {int(channel_id): (lmi['id'], lmi['timestamp']) for channel_id, lmi in legacy.items()}
+    self.compact()
+    self.log.info('Migrated %d checkpoints from %s', len(self.data), self.legacy_file_path)
+
+  @staticmethod
+  def __parse(line: str) -> tuple[int, int, float] | None:
+    match line.split() if line.endswith('\n') else None:
+      case [channel_id, message_id, timestamp]:
+        try:
+          return int(channel_id), int(message_id), float(timestamp)
+        except ValueError:
+          return None
+      case _:
+        return None
+
+  def __len__(self) -> int:
+    return len(self.data)
+
+  def last_message_id(self, channel_id: int) -> int | None:
+    return entry[0] if (entry := self.data.get(channel_id)) is not None else None
+
+  def update(self, channel_id: int, message_id: int, timestamp: float) -> None:
+    """Moves the checkpoint of a channel forward (never backward), written on the next batch"""
+    if (last := self.last_message_id(channel_id)) is None or message_id > last:
+      self.data[channel_id] = (message_id, timestamp)
+      self.__dirty.add(channel_id)
+    if len(self.__dirty) >= self.flush_size or time.monotonic() - self.__last_flush >= self.flush_interval:
+      self.__schedule_flush()
+
+  def __schedule_flush(self) -> None:
+    try:
+      loop = asyncio.get_running_loop()
+    except RuntimeError: # no event loop to block
+      self.save()
+      return
+    self.__last_flush = time.monotonic()
+    if self.__flushing is None or self.__flushing.done():
+      self.__flushing = loop.create_task(self.flush())
+
+  async def flush(self) -> None:
+    """Writes the updated checkpoints like `save`, with the file writes run in a thread"""
+    async with self.__lock:
+      if (batch := self.__take()) is None:
+        return
+      compact, text, channel_ids = batch
+      self.__unwritten = channel_ids
+      try:
+        await asyncio.to_thread(self.__write_taken, self.__n_taken, compact, text)
+      except OSError as e:
+        self.__unwritten = set()
+        self.__dirty |= channel_ids # retried with the next batch
+        self.log.error('Could not save %d checkpoints: %s', len(channel_ids), e)
+
+  def __write_taken(self, n_taken: int, compact: bool, text: str) -> None:
+    with self.__file_lock:
+      if n_taken != self.__n_taken:
+        return # a `save` took a later batch, with these channels
+      self.__write(compact, text)
+      self.__unwritten = set()
+
+  def save(self) -> None:
+    """Appends the updated checkpoints to the log, compacting it when it grew too large (blocking)"""
+    with self.__file_lock: # waits for the write of a background batch
+      self.__dirty |= self.__unwritten
+      self.__unwritten = set()
+      if (batch := self.__take()) is None:
+        return
+      compact, text, channel_ids = batch
+      try:
+        self.__write(compact, text)
+      except OSError:
+        self.__dirty |= channel_ids
+        raise
+
+  def compact(self) -> None:
+    """Rewrites the log with one line per channel"""
+    self.__write(True, ''.join(self.__line(channel_id) for channel_id in self.data))
+    self.__n_lines = len(self.data)
+    self.__dirty.clear()
+
+  def __take(self) -> tuple[bool, str, set[int]] | None:
+    """Takes the batch to write : whether it rewrites the log, its lines and its channels"""
+    self.__last_flush = time.monotonic()
+    if not self.__dirty:
+      return None
+    self.__n_taken += 1
+    channel_ids, self.__dirty = self.__dirty, set()
+    if self.__n_lines + len(channel_ids) > 2 * len(self.data):
+      self.__n_lines = len(self.data)
+      return True, ''.join(self.__line(channel_id) for channel_id in self.data), channel_ids
+    self.__n_lines += len(channel_ids)
+    return False, ''.join(self.__line(channel_id) for channel_id in channel_ids), channel_ids
+
+  def __write(self, compact: bool, text: str) -> None:
+    if not compact:
+      with open(self.file_path, 'a', encoding='utf-8') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+      return
+    tmp_path = f'{self.file_path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+      f.write(text)
+      f.flush()
+      os.fsync(f.fileno())
+    os.replace(tmp_path, self.file_path)
+    self.__fsync_dir()
+
+  def __line(self, channel_id: int) -> str:
+    message_id, timestamp = self.data[channel_id]
+    return f'{channel_id} {message_id} {timestamp}\n'
+
+  def __fsync_dir(self) -> None:
+    # makes the rename itself durable
+    fd = os.open(os.path.dirname(self.file_path) or '.', os.O_RDONLY)
+    try:
+      os.fsync(fd)
+    finally:
+      os.close(fd)
@@ -1,16 +1,15 @@
+import asyncio
 import signal
 import sys
-import os
 
 import logging
 import datetime
+import time
 import math
-from functools import lru_cache
 
 from typing import Any
 from typing_extensions import override
 
-from pyjson5 import decode_io, encode_io # pylint: disable=no-name-in-module
 import discord
 from discord.ext import commands
 from discord.message import Message
@@ -20,41 +19,24 @@ from ..helper.logger import init_logger
 from ..messages import MessageSender, Embedder
 from ..commands import *
 from ..db import *
-from ..events import TaskManager
+from ..events import TaskManager, LevelUpPipeline, AutoResponseData, AutoResponseRules, ReactionDispatcher
+
+from .backfill import HistoryBackfill, XP_BACKFILL
+from .checkpoints import ChannelToLastMessageInfo
+from .ingestion import IngestionQueue
+from .xp_throttle import XpThrottle
 
 from ..version import __version__
 
 __all__ = ['UsefulClient']
 
 
-class ChannelToLastMessageInfo:
-  file_path = 'data/last_message.json5'
-  lmi = dict[str, int | float]
-
-  def __init__(self) -> None:
-    os.makedirs('data', exist_ok=True)
-    self.data: dict[int, self.lmi] = {}
-
-    self.__load()
-
-  def __load(self) -> None:
-    try:
-      with open(self.file_path, 'r', encoding='utf-8') as f:
-        self.data = decode_io(f)
-    except FileNotFoundError:
-      pass
-
-  def __save(self) -> None: # pylint: disable=unused-private-member
-    with open(self.file_path, 'w', encoding='utf-8') as f:
-      encode_io(self.data, f)
-
-
 class UsefulClient(commands.AutoShardedBot):
   """
   ## Description
   The client class for the bot.
   """
-  MAX_LVL = 100
+  MAX_LVL = MAX_LVL
 
   def __init__(self, prefix: str = '!', invite: str = None, **options):
     init_logger()
@@ -65,8 +47,17 @@ class UsefulClient(commands.AutoShardedBot):
     super().__init__(command_prefix=prefix, intents=intents, **options)
 
     self.__db = UsefulDatabase()
+    self.__xp_buffer = XpBuffer(self.__db)
+    self.__xp_throttle = XpThrottle()
+    self.__checkpoints = ChannelToLastMessageInfo()
+    self.__backfill = HistoryBackfill(self.__checkpoints, self.__xp_buffer, self.xp_from_message)
+    self.__backfill_task: asyncio.Task | None = None
+    self.__ingestion = IngestionQueue(self.handle_message)
+    self.__auto_responses = AutoResponseRules(self.__db)
+    self.__reactions = ReactionDispatcher()
     self.__dispatcher: MessageSender = MessageSender()
     self.__embed_builder: Embedder = Embedder()
+    self.__level_ups = LevelUpPipeline(self, self.__dispatcher, self.__embed_builder)
 
     self.log = logging.getLogger('resistance.client')
 
@@ -82,6 +73,10 @@ class UsefulClient(commands.AutoShardedBot):
   def start_time(self) -> float:
     return self.__start_time.timestamp()
 
+  @property
+  def xp_buffer(self) -> XpBuffer:
+    return self.__xp_buffer
+
   @property
   def dispatcher(self) -> MessageSender:
     return self.__dispatcher
@@ -102,7 +97,16 @@ class UsefulClient(commands.AutoShardedBot):
     )
 
     if not self.__started_once:
-      TaskManager(self, self.__db, self.dispatcher, self.embed_builder).run.start() # pylint: disable=no-member
+      TaskManager(self, self.__db, self.dispatcher, self.embed_builder).run.start()
+      self.__xp_buffer.run.start()
+      self.__level_ups.announce.start()
+      self.__level_ups.grant_roles.start()
+      self.__auto_responses.reload.start()
+      self.__db.roll_over.start()
+      await self.__db.load_ranks(guild.id for guild in self.guilds)
+      if XP_BACKFILL:
+        channels = self.__backfill.readable_channels(self.guilds)
+        self.__backfill_task = asyncio.create_task(self.__backfill.run(channels))
       self.log.info('Logged in as %s (ID: %d)', self.user, self.user.id)
       self.log.info('Connected to %d guilds', len(self.guilds))
 
@@ -117,8 +121,16 @@ class UsefulClient(commands.AutoShardedBot):
 
     self.log.info('Messing around ...')
 
-    self.__db.test()
-    self.__db.connect()
+    start = time.perf_counter()
+    if self.__db.connect() and self.__db.test():
+      await self.__db.ensure_indexes()
+      await self.__db.check_query_plans()
+    self.log.info('Database startup took %.0fms', (time.perf_counter() - start) * 1000)
+
+    if XP_BACKFILL:
+      self.__backfill.hold() # live messages may come before the crawl starts, in on_ready
+    self.__ingestion.start()
+    self.__ingestion.report.start()
 
     signal.signal(signal.SIGINT, self.on_end)
     signal.signal(signal.SIGTERM, self.on_end)
@@ -187,6 +199,18 @@ class UsefulClient(commands.AutoShardedBot):
     print('', end='\r')
     self.log.warning('Received signal %s, shutting down...', signal.Signals(sig).name)
     self.log.info('Shutting down...')
+    if self.__backfill_task is not None:
+      self.__backfill_task.cancel()
+    if n_left := self.__ingestion.stop():
+      self.log.warning('Dropped %d queued messages', n_left)
+    try:
+      self.__xp_buffer.flush_blocking()
+    except Exception as e: # pylint: disable=broad-except
+      self.log.error('Could not flush the buffered XP: %s', e)
+    try:
+      self.__checkpoints.save()
+    except OSError as e:
+      self.log.error('Could not save the checkpoints: %s', e)
     self.__db.disconnect()
     self.log.info('Shutdown complete')
     sys.exit(0)
@@ -205,23 +229,15 @@ class UsefulClient(commands.AutoShardedBot):
     self.log.info('Setting up complete')
 
   @staticmethod
-  @lru_cache(maxsize=None)
   def lvl_to_xp(lvl: int) -> int:
     """Converts a level to xp."""
-    return int(1.6412*lvl*lvl*lvl + 23.441*lvl*lvl + 67.981*lvl)
+    return lvl_to_xp(lvl)
 
   def xp_to_lvl(self, xp: int) -> int:
     """Converts xp to a level."""
-    if xp < 0:
-      return 0
-
-    if xp < UsefulClient.lvl_to_xp(1):
-      return 0
-    for i in range(1, UsefulClient.MAX_LVL):
-      if UsefulClient.lvl_to_xp(i) <= xp < UsefulClient.lvl_to_xp(i + 1):
-        return i
-    self.log.warning('Maximum level hit with %d xp', xp)
-    return UsefulClient.MAX_LVL
+    if (lvl := xp_to_lvl(xp)) == UsefulClient.MAX_LVL:
+      self.log.warning('Maximum level hit with %d xp', xp)
+    return lvl
 
   @staticmethod
   def xp_from_msg_len(msg_len: int) -> int:
@@ -231,8 +247,6 @@ class UsefulClient(commands.AutoShardedBot):
     xp_to_add = UsefulClient.xp_from_msg_len(len(message.content)) +\
                 5 * len(message.attachments) +\
                 2 * len(message.stickers)
-    # todo: scale down based on how much the user spams
-
     return xp_to_add
 
   @override
@@ -242,22 +256,50 @@ class UsefulClient(commands.AutoShardedBot):
     return # todo: remove this line to enable xp and event dispatching
 
     # pylint: disable=unreachable
+    # processed by the ingestion workers, so that the gateway events keep flowing
+    await self.__ingestion.put(message)
+
+  async def handle_message(self, message: Message) -> None:
     if message.author.bot:
       return await self.process_cmd(message)
     await self.process_msg(message)
+    rules = self.__auto_responses.matcher.match(message.content)
+    await self.do_auto_responses(message, rules)
+    await self.dispatch_reactions(message, rules)
 
   async def process_msg(self, message: Message):
-    self.__db.create_user(message.author.id, message.author.name)
-    old_xp = self.__db.add_xp_to_user(message.author.id, xp_added := self.xp_from_message(message))
+    self.__backfill.track(message)
+    # scaled down based on how much the user spams
+    if (xp_added := self.__xp_throttle.scale(message.guild.id, message.author.id,
+                                             self.xp_from_message(message))) <= 0:
+      return # nothing to store nor level up
+    old_xp = await self.__xp_buffer.add(message.guild.id, message.author.id, message.author.name, xp_added)
     new_xp = old_xp + xp_added
-    old_lvl, new_lvl = self.xp_to_lvl(old_xp), self.xp_to_lvl(new_xp) # pylint: disable=unused-variable
-                                                                      # todo: lvl up event
+    if (new_lvl := self.xp_to_lvl(new_xp)) > (old_lvl := self.xp_to_lvl(old_xp)):
+      self.__level_ups.push(message, old_lvl, new_lvl)
 
   async def process_cmd(self, message: Message): # pylint: disable=unused-argument
     ...
 
-  async def dispatch_reactions(self, message: Message): # pylint: disable=unused-argument
-    ...
+  async def dispatch_reactions(self, message: Message, rules: list[AutoResponseData]):
+    if emotes := [emote for rule in rules for emote in rule.emotes]:
+      self.__reactions.push(message, emotes)
 
-  async def do_auto_responses(self, message: Message): # pylint: disable=unused-argument
-    ...
+  async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
+    self.__reactions.cancel(payload.channel_id, payload.message_id)
+
+  async def on_raw_bulk_message_delete(self, payload: discord.RawBulkMessageDeleteEvent):
+    for message_id in payload.message_ids:
+      self.__reactions.cancel(payload.channel_id, message_id)
+
+  async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel):
+    self.__reactions.cancel(channel.id)
+
+  async def do_auto_responses(self, message: Message, rules: list[AutoResponseData]):
+    for rule in rules:
+      if not rule.answer:
+        continue
+      if rule.reply:
+        await message.reply(rule.answer)
+      else:
+        await message.channel.send(rule.answer)
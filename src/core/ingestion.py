@@ -0,0 +1,172 @@
+import os
+
+import asyncio
+import logging
+import time
+from collections.abc import Callable, Coroutine
+from dataclasses import dataclass
+from typing import Any
+
+from discord.ext import tasks
+from discord.message import Message
+
+from ..helper import AutoNumberedEnum
+
+__all__ = ['Backpressure', 'IngestionQueue', 'IngestionStats']
+
+
+class Backpressure(AutoNumberedEnum):
+  """What to do with a message when the ingestion queue is full"""
+
+  BLOCK = ('block') # wait for room, which holds the gateway event handler
+  DROP = ('drop')   # drop the incoming message
+  SHED = ('shed')   # drop the oldest queued message to make room for the incoming one
+
+  def __init__(self, s: str):
+    self.s = s
+
+  @classmethod
+  def from_str(cls, s: str) -> 'Backpressure':
+    for policy in cls:
+      if policy.s == s.lower():
+        return policy
+    raise ValueError(f'Unknown backpressure policy: {s}')
+
+
+INGEST_QUEUE_SIZE = int(os.getenv('INGEST_QUEUE_SIZE', '1000'))
+INGEST_WORKERS = int(os.getenv('INGEST_WORKERS', '4'))
+INGEST_BACKPRESSURE = Backpressure.from_str(os.getenv('INGEST_BACKPRESSURE', 'shed'))
+
+
+@dataclass
+class IngestionStats:
+  """
+  ## Description
+  Counters of an `IngestionQueue` since its last report.
+  """
+
+  depth: int
+  maxsize: int
+  processed: int
+  dropped: int
+  failed: int
+  wait_ms: float    # average time spent in the queue
+  max_wait_ms: float
+  process_ms: float # average time spent in the handler
+
+  def __str__(self) -> str:
+    return f'depth {self.depth}/{self.maxsize}, {self.processed} processed, {self.dropped} dropped, '\
+           f'{self.failed} failed, wait {self.wait_ms:.1f}ms (max {self.max_wait_ms:.1f}ms), '\
+           f'processing {self.process_ms:.1f}ms'
+
+
+class IngestionQueue:
+  """
+  ## Description
+  Bounded queue between the gateway `on_message` event and the message processing.\\
+  `workers` tasks consume the queue concurrently, so a slow database only delays the
+  queued messages instead of the event dispatch of the whole shard. When the queue is full,
+  `policy` decides whether to wait, drop the new message or shed the oldest one.
+  """
+
+  def __init__(
+    self,
+    handler: Callable[[Message], Coroutine[Any, Any, None]],
+    maxsize: int = INGEST_QUEUE_SIZE,
+    workers: int = INGEST_WORKERS,
+    policy: Backpressure = INGEST_BACKPRESSURE,
+  ):
+    self.handler = handler
+    self.policy = policy
+    self.n_workers = max(1, workers)
+    self.__queue: asyncio.Queue[tuple[float, Message]] = asyncio.Queue(maxsize)
+    self.__workers: list[asyncio.Task] = []
+    self.__reset_stats()
+
+    self.log = logging.getLogger('resistance.ingestion')
+
+  def __reset_stats(self) -> None:
+    self.__processed = 0
+    self.__dropped = 0
+    self.__failed = 0
+    self.__wait = 0.0
+    self.__max_wait = 0.0
+    self.__processing = 0.0
+
+  @property
+  def depth(self) -> int:
+    return self.__queue.qsize()
+
+  @property
+  def stats(self) -> IngestionStats:
+    n = self.__processed + self.__failed
+    return IngestionStats(
+      self.depth,
+      self.__queue.maxsize,
+      self.__processed,
+      self.__dropped,
+      self.__failed,
+      self.__wait / n * 1000 if n else 0.0,
+      self.__max_wait * 1000,
+      self.__processing / n * 1000 if n else 0.0,
+    )
+
+  async def put(self, message: Message) -> bool:
+    """Queues a message and returns False if it (or an older message) was dropped"""
+    item = (time.monotonic(), message)
+    if self.policy is Backpressure.BLOCK:
+      await self.__queue.put(item)
+      return True
+    if self.__queue.full():
+      self.__dropped += 1
+      if self.policy is Backpressure.DROP:
+        return False
+      self.__queue.get_nowait()
+      self.__queue.task_done()
+      self.__queue.put_nowait(item)
+      return False
+    self.__queue.put_nowait(item)
+    return True
+
+  def start(self) -> None:
+    if not self.__workers:
+      self.__workers = [
+        asyncio.create_task(self.__work(), name=f'ingestion-{i}') for i in range(self.n_workers)
+      ]
+
+  def stop(self) -> int:
+    """Cancels the workers and returns the number of messages left unprocessed"""
+    for worker in self.__workers:
+      worker.cancel()
+    self.__workers = []
+    return self.depth
+
+  async def join(self) -> None:
+    """Waits until every queued message is processed"""
+    await self.__queue.join()
+
+  async def __work(self) -> None:
+    while True:
+      queued_at, message = await self.__queue.get()
+      start = time.monotonic()
+      try:
+        await self.handler(message)
+        self.__processed += 1
+      except Exception as e: # pylint: disable=broad-except
+        self.__failed += 1
+        self.log.error('Could not process message %d: %s', message.id, e)
+      finally:
+        self.__queue.task_done()
+      self.__wait += start - queued_at
+      self.__max_wait = max(self.__max_wait, start - queued_at)
+      self.__processing += time.monotonic() - start
+
+  @tasks.loop(minutes=1.0)
+  async def report(self) -> None:
+    """Logs the queue metrics of the last minute"""
+    stats = self.stats
+    if stats.dropped or stats.depth >= stats.maxsize // 2:
+      self.log.warning('Ingestion is falling behind: %s', stats)
+    elif stats.processed:
+      self.log.debug('Ingestion: %s', stats)
+    self.__reset_stats()
@@ -0,0 +1,70 @@
+import os
+
+import math
+import time
+from array import array
+
+__all__ = ['XpThrottle']
+
+XP_THROTTLE_BURST = float(os.getenv('XP_THROTTLE_BURST', '5'))
+XP_THROTTLE_RATE = float(os.getenv('XP_THROTTLE_RATE', '0.1'))
+
+
+class XpThrottle:
+  """
+  ## Description
+  Per member token bucket that scales XP down when someone spams.\\
+  Every message spends up to one token and earns its XP times the spent fraction : a member
+  may post `burst` messages in a row at full XP, then earns as fast as the bucket refills
+  (`rate` tokens per second), so a flood quickly rounds down to 0 XP.
+
+  Buckets live in two parallel arrays indexed through a `(guild_id, user_id) -> slot` map.
+  A bucket idle long enough to be full again carries no information and its slot is recycled,
+  so memory only grows with the number of members active within that delay.
+  """
+
+  __slots__ = ('burst', 'rate', 'idle_after', '__buckets', '__tokens', '__seen', '__free', '__next_sweep')
+
+  def __init__(self, burst: float = XP_THROTTLE_BURST, rate: float = XP_THROTTLE_RATE):
+    self.burst = burst
+    self.rate = rate
+    self.idle_after = burst / rate if rate > 0 else math.inf
+    self.__buckets: dict[tuple[int, int], int] = {}
+    self.__tokens = array('d')
+    self.__seen = array('d') # last time each bucket was refilled
+    self.__free: list[int] = []
+    self.__next_sweep = 0.0
+
+  def __len__(self) -> int:
+    return len(self.__buckets)
+
+  def scale(self, guild_id: int, user_id: int, xp: int, now: float | None = None) -> int:
+    """Returns the XP a message is worth once throttled, possibly 0"""
+    if (now := time.monotonic() if now is None else now) >= self.__next_sweep:
+      self.evict_idle(now)
+
+    if (slot := self.__buckets.get((guild_id, user_id))) is None:
+      slot = self.__free.pop() if self.__free else self.__grow()
+      self.__buckets[(guild_id, user_id)] = slot
+      tokens = self.burst
+    else:
+      tokens = min(self.burst, self.__tokens[slot] + (now - self.__seen[slot]) * self.rate)
+
+    spent = min(1.0, tokens)
+    self.__tokens[slot] = tokens - spent
+    self.__seen[slot] = now
+    return round(xp * spent)
+
+  def evict_idle(self, now: float | None = None) -> int:
+    """Recycles the buckets that refilled completely and returns how many were evicted"""
+    now = time.monotonic() if now is None else now
+    self.__next_sweep = now + self.idle_after
+    idle = [key for key, slot in self.__buckets.items() if now - self.__seen[slot] >= self.idle_after]
+    for key in idle:
+      self.__free.append(self.__buckets.pop(key))
+    return len(idle)
+
+  def __grow(self) -> int:
+    self.__tokens.append(0.0)
+    self.__seen.append(0.0)
+    return len(self.__tokens) - 1
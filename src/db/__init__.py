@@ -1 +1,7 @@
+from .backend import *
+from .rank_index import *
+from .mongo_backend import *
+from .sqlite_backend import *
 from .database import *
+from .leaderboard import *
+from .xp_buffer import *
@@ -0,0 +1,178 @@
+import os
+
+import time
+from abc import ABC, abstractmethod
+from array import array
+from collections.abc import Iterator
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any
+
+__all__ = ['StorageBackend', 'ExportUserEntry', 'UserColumns', 'Period', 'xp_day']
+
+DB_BATCH_SIZE = int(os.getenv('DB_BATCH_SIZE', '1000'))
+# daily XP buckets older than this are dropped, their XP only remains in the lifetime totals
+XP_HISTORY_DAYS = int(os.getenv('XP_HISTORY_DAYS', '30'))
+
+
+def split_xp(xp: int, n: int) -> list[int]:
+  """Splits legacy XP evenly between `n` guilds, the first ones getting the remainder"""
+  return [xp//n + (i < xp % n) for i in range(n)]
+
+
+def xp_day(timestamp: float | None = None) -> int:
+  """Returns the (UTC) day number of a timestamp, the key of the daily XP buckets"""
+  return int((time.time() if timestamp is None else timestamp) // 86400)
+
+
+def bucket_day(day: int | None) -> int | None:
+  """Returns the bucket an increment of `day` (today by default) goes to, None if it is already compacted"""
+  today = xp_day()
+  day = today if day is None else day
+  return day if day > today - XP_HISTORY_DAYS else None
+
+
+class Period(Enum):
+  """Leaderboard windows, valued by their number of daily buckets (0 for the lifetime XP)"""
+
+  ALL = 0
+  WEEK = 7
+  MONTH = 30
+
+  @property
+  def first_day(self) -> int:
+    """The oldest bucket of the window, today being its last one"""
+    return xp_day() - self.value + 1
+
+
+@dataclass(slots=True)
+class ExportUserEntry:
+  """
+  ## Description
+  An entry of the export user list.
+  """
+
+  id: int
+  xp: int
+
+
+class UserColumns:
+  """
+  ## Description
+  Users stored as two parallel arrays of 64 bits integers (ids and XP), about 16 bytes per user,
+  for bulk scans that do not need one object per row.
+  """
+
+  __slots__ = ('ids', 'xps')
+
+  def __init__(self) -> None:
+    self.ids = array('q')
+    self.xps = array('q')
+
+  def __len__(self) -> int:
+    return len(self.ids)
+
+  def __iter__(self) -> Iterator[tuple[int, int]]:
+    return zip(self.ids, self.xps)
+
+  def append(self, user_id: int, xp: int) -> None:
+    self.ids.append(user_id)
+    self.xps.append(xp)
+
+
+class StorageBackend(ABC):
+  """
+  ## Description
+  The storage interface behind `UsefulDatabase`.\\
+  Every method is blocking : `UsefulDatabase` takes care of running them off the event loop.
+  """
+
+  name: str = 'storage'
+
+  @property
+  @abstractmethod
+  def connected(self) -> bool:
+    """Whether the backend is ready to serve queries"""
+
+  @abstractmethod
+  def connect(self) -> bool:
+    """Opens the backend and returns True on success"""
+
+  @abstractmethod
+  def disconnect(self) -> bool:
+    """Closes the backend and returns True if it was open"""
+
+  @abstractmethod
+  def test(self) -> None:
+    """Cheaply checks that the open backend answers (no write), raises on failure"""
+
+  @abstractmethod
+  def ensure_indexes(self) -> list[str]:
+    """Creates the missing indexes and returns their names"""
+
+  @abstractmethod
+  def check_query_plans(self) -> list[str]:
+    """Returns the names of the hot queries that scan a whole table"""
+
+  @abstractmethod
+  def add_xp_to_user(self,
+                     guild_id: int,
+                     user_id: int,
+                     username: str,
+                     amount: int,
+                     day: int | None = None) -> int:
+    """
+    Atomically adds XP to a guild member, creating it if needed, and returns the XP before the update.\\
+    The increment is also counted in the bucket of `day` (today by default).
+    """
+
+  @abstractmethod
+  def bulk_add_xp(self, deltas: dict[tuple[int, int], tuple[str, int]], day: int | None = None) -> int:
+    """
+    Applies many increments at once and returns the number of touched members.\\
+    `deltas` maps `(guild_id, user_id)` keys to `(username, xp_delta)` pairs ;
+    they are also counted in the buckets of `day` (today by default).
+    """
+
+  @abstractmethod
+  def period_users(self, guild_id: int, first_day: int) -> list[ExportUserEntry]:
+    """Returns the members of a guild with the XP they earned since `first_day`, by decreasing XP"""
+
+  @abstractmethod
+  def compact_days(self, first_day: int) -> int:
+    """Drops the buckets older than `first_day` and returns the number of updated records"""
+
+  @abstractmethod
+  def get_user_xp(self, guild_id: int, user_id: int) -> int:
+    """Returns the XP of a guild member or -1 if the member does not exist"""
+
+  @abstractmethod
+  def users(self, guild_id: int, batch_size: int = DB_BATCH_SIZE) -> list[ExportUserEntry]:
+    """Returns a list of all members of a guild"""
+
+  @abstractmethod
+  def user_columns(self, guild_id: int, batch_size: int = DB_BATCH_SIZE) -> UserColumns:
+    """Streams all members of a guild into parallel arrays, `batch_size` rows at a time"""
+
+  @abstractmethod
+  def top_users(self, guild_id: int, n: int) -> list[ExportUserEntry]:
+    """Returns a list of the top n members of a guild"""
+
+  @abstractmethod
+  def legacy_user_ids(self) -> list[int]:
+    """Returns the ids of the users stored before XP was split per guild"""
+
+  @abstractmethod
+  def migrate_legacy_users(self, assignments: dict[int, list[int]]) -> int:
+    """
+    Splits the XP of legacy users between the guilds they are assigned to (`user_id -> [guild_id]`,
+    see `split_xp`) and deletes their legacy record ; returns the number of migrated users.
+    """
+
+  @abstractmethod
+  def get_config(self) -> list[dict[str, Any]]:
+    """Returns the config"""
+
+  @abstractmethod
+  def get_events(self) -> list[dict[str, Any]]:
+    """Load and returns the enabled events"""
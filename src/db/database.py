@@ -1,101 +1,144 @@
 import os
 
+import asyncio
+import functools
 import logging
-from collections.abc import Generator
-from dataclasses import dataclass
-from typing import Any
+import threading
+import time
+from collections.abc import Callable, Coroutine, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, ParamSpec, TypeVar
 
-from pymongo import MongoClient
-from pymongo.collection import Collection
+from discord.ext import tasks
 
-__all__ = ['UsefulDatabase', 'ExportUserEntry']
+from ..helper.cache import CacheStats, TtlLruCache
 
-DB_USER = os.getenv('DB_USER', '')
-DB_PASSWD = os.getenv('DB_PASSWD', '')
-DB_URL = os.getenv('DB_URL', '')
-DB_PORT = os.getenv('DB_PORT', None)
-CONNECTION_STRING = f'mongodb+srv://{DB_USER}:{DB_PASSWD}@{DB_URL}/?retryWrites=true&w=majority'
+from .backend import *
+from .backend import DB_BATCH_SIZE, XP_HISTORY_DAYS
+from .rank_index import *
+from .mongo_backend import *
+from .sqlite_backend import *
 
+__all__ = ['UsefulDatabase', 'make_backend']
 
-@dataclass
-class ExportUserEntry:
+DB_BACKEND = os.getenv('DB_BACKEND', '')
+DB_WORKERS = int(os.getenv('DB_WORKERS', '4'))
+XP_CACHE_SIZE = int(os.getenv('XP_CACHE_SIZE', '1024'))
+XP_CACHE_TTL = float(os.getenv('XP_CACHE_TTL', '60'))
+
+P = ParamSpec('P')
+R = TypeVar('R')
+
+
+def make_backend(name: str = DB_BACKEND) -> StorageBackend:
   """
-  ## Description
-  An entry of the export user list.
+  Builds the storage backend named `name` (`mongo` or `sqlite`).\\
+  Defaults to MongoDB when credentials are provided and to the local SQLite file otherwise.
+  """
+  match name or ('mongo' if HAS_MONGO_CREDENTIALS else 'sqlite'):
+    case 'mongo':
+      return MongoBackend()
+    case 'sqlite':
+      return SqliteBackend()
+    case _:
+      raise ValueError(f'Unknown database backend: {name}')
+
+
+def awaitable(func: Callable[P, R]) -> Callable[P, Coroutine[Any, Any, R]]:
+  """
+  Turns a blocking `UsefulDatabase` method into a coroutine that runs
+  on the database worker pool instead of the event loop.
   """
 
-  id: int
-  xp: int
+  @functools.wraps(func)
+  async def wrapper(self: 'UsefulDatabase', *args: P.args, **kwargs: P.kwargs) -> R:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(self.executor, functools.partial(func, self, *args, **kwargs))
+
+  return wrapper
 
 
 class UsefulDatabase:
   """
   ## Description
-  The database class for the bot.
+  The database class for the bot.\\
+  Queries are delegated to a `StorageBackend` and awaited on a bounded worker pool.
+  XP lookups are served from a read-through cache that the XP writes keep up to date,
+  and ranks from an in-memory `RankIndex` loaded with `load_ranks`. The `roll_over` task
+  drops the daily XP buckets that no `Period` reaches anymore, once a day.
   """
 
-  def __init__(self):
-    self.__client: MongoClient = None
+  def __init__(
+    self,
+    backend: StorageBackend | None = None,
+    workers: int = DB_WORKERS,
+    cache_size: int = XP_CACHE_SIZE,
+    cache_ttl: float = XP_CACHE_TTL,
+    batch_size: int = DB_BATCH_SIZE,
+  ):
+    self.__backend = backend if backend is not None else make_backend()
+    self.__executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='resistance-db')
+    self.batch_size = max(1, batch_size) # rows per fetch of the member scans
+    self.__xp_cache: TtlLruCache[tuple[int, int], int] = TtlLruCache(cache_size, cache_ttl)
+    self.__top_cache: TtlLruCache[tuple[int, int], list[ExportUserEntry]] = TtlLruCache(8, cache_ttl)
+    self.__ranks: dict[int, RankIndex] = {}
+    self.__day: int | None = None        # of the last bucket compaction
+    self.__compacting = threading.Lock()
     self.log = logging.getLogger('resistance.db')
 
   @property
-  def client(self) -> MongoClient:
-    return self.__client
+  def backend(self) -> StorageBackend:
+    return self.__backend
 
   @property
-  def tests_collection(self) -> Collection:
-    return self.client.usefull.tests
+  def executor(self) -> ThreadPoolExecutor:
+    return self.__executor
 
   @property
-  def users_collection(self) -> Collection:
-    return self.client.BDMFR.Utilisateurs
+  def connected(self) -> bool:
+    return self.__backend.connected
 
-  @property
-  def tasks_collection(self) -> Collection:
-    return self.client.Resistance.Tasks
+  def ranks(self, guild_id: int) -> RankIndex:
+    """Returns the rank index of a guild"""
+    if (ranks := self.__ranks.get(guild_id)) is None:
+      ranks = self.__ranks[guild_id] = RankIndex()
+    return ranks
 
   @property
-  def config_collection(self) -> Collection:
-    return self.client.Resistance.Config
+  def cache_stats(self) -> dict[str, CacheStats]:
+    return {'xp': self.__xp_cache.stats, 'top': self.__top_cache.stats}
 
   def connect(self) -> bool:
-    self.log.info('Connecting to database...')
+    self.log.info('Connecting to database (%s)...', self.__backend.name)
     r = False
-    if DB_USER != '' and DB_PASSWD != '':
-      try:
-        self.__client = MongoClient(CONNECTION_STRING, port=int(DB_PORT) if DB_PORT else None)
-        self.log.info('Connected to database')
-        r = True
-      except Exception as e: # pylint: disable=broad-except
-        self.log.error('Could not connect to database: %s', e)
-    else:
-      self.log.warning('No database credentials provided, skipping connection')
+    try:
+      r = self.__backend.connect()
+      self.log.info('Connected to database')
+    except Exception as e: # pylint: disable=broad-except
+      self.log.error('Could not connect to database: %s', e)
     return r
 
   def disconnect(self) -> bool:
     self.log.info('Disconnecting from database...')
-    r = False
-    if self.__client is not None:
-      self.__client.close()
-      self.__client = None
+    for name, stats in self.cache_stats.items():
+      self.log.debug('%s cache: %s', name, stats)
+    if r := self.__backend.disconnect():
       self.log.info('Disconnected from database')
-      r = True
     else:
       self.log.warning('No database connection to close')
     return r
 
-  def test(self):
+  def test(self) -> bool:
+    """Pings the database on the open connection, which stays open for the rest of the run"""
     self.log.info('Testing database connection...')
     try:
-      if self.connect():
-        r = self.tests_collection.insert_one({'test': 'test'})
-        assert r.acknowledged and r.inserted_id is not None
-        r = self.tests_collection.delete_one({'test': 'test'})
-        assert r.acknowledged and r.deleted_count == 1
-        self.disconnect()
-      self.log.info('Test successful')
+      start = time.perf_counter()
+      self.__backend.test()
+      self.log.info('Test successful (%.0fms)', (time.perf_counter() - start) * 1000)
+      return True
     except Exception as e: # pylint: disable=broad-except
       self.log.error('Test failed: %s', e)
+      return False
 
   def __enter__(self) -> 'UsefulDatabase':
     self.connect()
@@ -106,64 +149,178 @@ class UsefulDatabase:
     return False
 
   def __del__(self):
-    if self.client is not None:
+    if self.connected:
       self.disconnect()
+    self.__executor.shutdown(wait=False)
 
-  def __get_user_entry(self, user_id: int) -> dict:
-    return self.users_collection.find_one({'id_user': user_id})
+  @awaitable
+  def ensure_indexes(self) -> list[str]:
+    """Creates the missing indexes and returns their names"""
+    return self.__backend.ensure_indexes() if self.connected else []
 
-  def create_user(self, user_id: int, username: str) -> bool:
-    """Creates a new user and returns True if the user was created"""
-    if self.__get_user_entry(user_id) is not None:
-      return False
+  @awaitable
+  def check_query_plans(self) -> list[str]:
+    """Explains the hot queries and returns (and warns about) those that fall back to a collection scan"""
+    scans = self.__backend.check_query_plans() if self.connected else []
+    for name in scans:
+      self.log.warning('Query \'%s\' is doing a collection scan (COLLSCAN)', name)
+    return scans
+
+  @awaitable
+  def compact_days(self, first_day: int) -> int | None:
+    """Drops the daily XP buckets older than `first_day`, or returns None if a compaction is running"""
+    if not self.__compacting.acquire(blocking=False): # pylint: disable=consider-using-with
+      return None
+    try:
+      return self.__backend.compact_days(first_day)
+    finally:
+      self.__compacting.release()
+
+  @tasks.loop(hours=1)
+  async def roll_over(self) -> None:
+    """Compacts the daily XP buckets on the first run of each day, apart from the XP writes"""
+    if not self.connected or (today := xp_day()) == self.__day:
+      return
+    try:
+      n = await self.compact_days(today - XP_HISTORY_DAYS + 1)
+    except Exception as e:                                            # pylint: disable=broad-except
+      self.log.error('Could not compact the daily XP buckets: %s', e) # retried on the next run
+      return
+    if n is not None:
+      self.__day = today
+      self.log.info('Compacted the daily XP buckets of %d records', n)
+
+  @awaitable
+  def __add_xp_to_user(self, guild_id: int, user_id: int, username: str, amount: int) -> int:
+    return self.__backend.add_xp_to_user(guild_id, user_id, username, amount)
+
+  async def add_xp_to_user(self, guild_id: int, user_id: int, username: str, amount: int) -> int:
+    """
+    Atomically adds XP to a guild member, creating it if needed, and returns the XP before the update.\\
+    This is a single round trip, so concurrent increments are never lost.
+    """
+    old_xp = await self.__add_xp_to_user(guild_id, user_id, username, amount)
+    self.__xp_cache.invalidate((guild_id, user_id))
+    self.__xp_cache.put((guild_id, user_id), old_xp + amount)
+    self.__top_cache.clear()
+    self.ranks(guild_id).update(user_id, old_xp + amount)
+    return old_xp
+
+  @awaitable
+  def __bulk_add_xp(self, deltas: dict[tuple[int, int], tuple[str, int]], day: int | None) -> int:
+    return self.__backend.bulk_add_xp(deltas, day)
+
+  async def bulk_add_xp(self, deltas: dict[tuple[int, int], tuple[str, int]], day: int | None = None) -> int:
+    """
+    Applies many XP increments in a single round trip, creating missing members.\\
+    `deltas` maps `(guild_id, user_id)` keys to `(username, xp_delta)` pairs, earned on `day`
+    (today by default) ; returns the number of touched members.
+    """
+    try:
+      return await self.__bulk_add_xp(deltas, day)
+    finally:
+      for key in deltas:
+        self.__xp_cache.invalidate(key)
+      self.__top_cache.clear()
+
+  def cache_user_xp(self, guild_id: int, user_id: int, xp: int) -> None:
+    """Caches the live XP of a member, including the increments not written yet"""
+    self.__xp_cache.invalidate((guild_id, user_id)) # a read in flight must not cache an older value
+    self.__xp_cache.put((guild_id, user_id), xp)
+
+  @awaitable
+  def __get_user_xp(self, guild_id: int, user_id: int) -> int:
+    return self.__backend.get_user_xp(guild_id, user_id)
+
+  async def get_user_xp(self, guild_id: int, user_id: int) -> int:
+    """Returns the XP of a guild member or -1 if the member does not exist"""
+    if (xp := self.__xp_cache.get((guild_id, user_id))) is not None:
+      return xp
+    generation = self.__xp_cache.generation
+    xp = await self.__get_user_xp(guild_id, user_id)
+    self.__xp_cache.put_if(generation, (guild_id, user_id), xp)
+    return xp
+
+  @awaitable
+  def users(self, guild_id: int) -> list[ExportUserEntry]:
+    """Returns a list of all members of a guild"""
+    return self.__backend.users(guild_id, self.batch_size)
+
+  @awaitable
+  def user_columns(self, guild_id: int) -> UserColumns:
+    """Returns all members of a guild as parallel arrays of ids and XP, for large scans"""
+    return self.__backend.user_columns(guild_id, self.batch_size)
+
+  async def load_ranks(self, guild_ids: Iterable[int]) -> int:
+    """Loads the stored members of every guild in their rank index and returns the number of ranked members"""
+    n = 0
+    if not self.connected:
+      return n
+    for guild_id in guild_ids:
+      ranks = self.ranks(guild_id)
+      ranks.load_columns(await self.user_columns(guild_id))
+      n += len(ranks)
+    self.log.info('Ranked %d members', n)
+    return n
+
+  async def user_rank(self, guild_id: int, user_id: int) -> UserRank | None:
+    """Returns the rank of a guild member from the rank index, or None if the member has no XP"""
+    if not self.ranks(guild_id).loaded: # guild joined after startup
+      await self.load_ranks([guild_id])
+    return self.ranks(guild_id).user_rank(user_id)
+
+  @awaitable
+  def __top_users(self, guild_id: int, n: int) -> list[ExportUserEntry]:
+    return self.__backend.top_users(guild_id, n)
+
+  async def top_users(self, guild_id: int, n: int) -> list[ExportUserEntry]:
+    """Returns a list of the top n members of a guild"""
+    if (top := self.__top_cache.get((guild_id, n))) is not None:
+      return top
+    generation = self.__top_cache.generation
+    top = await self.__top_users(guild_id, n)
+    self.__top_cache.put_if(generation, (guild_id, n), top)
+    return top
+
+  @awaitable
+  def period_users(self, guild_id: int, period: Period) -> list[ExportUserEntry]:
+    """Returns the members of a guild with the XP they earned during `period`, by decreasing XP"""
+    if period is Period.ALL:
+      return sorted(self.__backend.users(guild_id, self.batch_size), key=lambda entry: entry.xp, reverse=True)
+    return self.__backend.period_users(guild_id, period.first_day)
+
+  @awaitable
+  def legacy_user_ids(self) -> list[int]:
+    """Returns the ids of the users stored before XP was split per guild"""
+    return self.__backend.legacy_user_ids()
+
+  @awaitable
+  def __migrate_legacy_users(self, assignments: dict[int, list[int]]) -> int:
+    return self.__backend.migrate_legacy_users(assignments)
+
+  async def migrate_legacy_users(self, assignments: dict[int, list[int]]) -> int:
+    """
+    Splits the XP of legacy users evenly between the guilds they are assigned to (`user_id -> [guild_id]`),
+    deletes their legacy record and returns the number of migrated users.\\
+    Pause the `XpBuffer` around it, its totals are stale afterwards.
+    """
+    n = await self.__migrate_legacy_users(assignments)
+    self.__xp_cache.clear()
+    self.__top_cache.clear()
+    # the migrated totals are summed in the backend : reload the touched guilds from scratch
+    guild_ids = {guild_id for guild_ids in assignments.values() for guild_id in guild_ids}
+    for guild_id in guild_ids:
+      self.__ranks.pop(guild_id, None)
+    await self.load_ranks(guild_ids)
+    self.log.info('Migrated %d legacy users', n)
+    return n
 
-    self.users_collection.insert_one({
-      'id_user': user_id,
-      'name_user': username,
-      'XP': 0,
-    })
-    return True
-
-  def add_xp_to_user(self, user_id: int, amount: int) -> int:
-    """Updates user XP and return XP before update or -1 if the user does not exist"""
-    if (entry := self.__get_user_entry(user_id)) is not None:
-      self.users_collection.update_one(
-        {'id_user': user_id},
-        {'$inc': {
-          'XP': entry['XP'] + amount
-        }},
-      )
-      return entry['XP'] # return old xp
-    return -1
-
-  def get_user_xp(self, user_id: int) -> int:
-    """Returns user XP or -1 if the user does not exist"""
-    # BDMFR -> Utilisateurs -> {id_user, XP}
-    entry = self.__get_user_entry(user_id)
-    return entry['XP'] if entry is not None else -1
-
-  def users(self) -> Generator[ExportUserEntry, None, None]:
-    """Returns a generator of all users"""
-    for entry in self.users_collection.find():
-      yield ExportUserEntry(
-        id=entry['id_user'],
-        xp=entry['XP'],
-      )
-
-  def top_users(self, n: int) -> Generator[ExportUserEntry, None, None]:
-    """Returns a generator of the top n users"""
-    for entry in self.users_collection.find().sort('XP', -1).limit(n):
-      yield ExportUserEntry(
-        id=entry['id_user'],
-        xp=entry['XP'],
-      )
-
-  def get_config(self) -> Generator[dict[str, Any], None, None]:
+  @awaitable
+  def get_config(self) -> list[dict[str, Any]]:
     """Returns the config"""
-    for config in self.config_collection.find():
-      yield config
+    return self.__backend.get_config()
 
-  def get_events(self) -> Generator[dict[str, Any], None, None]:
-    """Load and returns the events"""
-    for task in self.tasks_collection.find():
-      yield task
+  @awaitable
+  def get_events(self) -> list[dict[str, Any]]:
+    """Load and returns the enabled events"""
+    return self.__backend.get_events()
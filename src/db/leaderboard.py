@@ -0,0 +1,125 @@
+import os
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+
+from .backend import ExportUserEntry, Period
+from .database import UsefulDatabase
+from .rank_index import RankIndex
+
+__all__ = ['LeaderboardSnapshot', 'LeaderboardSnapshots']
+
+LEADERBOARD_STALENESS = int(os.getenv('LEADERBOARD_STALENESS', '1000'))
+LEADERBOARD_MIN_AGE = float(os.getenv('LEADERBOARD_MIN_AGE', '10'))
+LEADERBOARD_MAX_AGE = float(os.getenv('LEADERBOARD_MAX_AGE', '300'))
+LEADERBOARD_PERIOD_TTL = float(os.getenv('LEADERBOARD_PERIOD_TTL', '60'))
+
+
+@dataclass(frozen=True, slots=True)
+class LeaderboardSnapshot:
+  """
+  ## Description
+  An immutable copy of the leaderboard of a guild over a period, shared by all the views showing it.\\
+  `source` is the rank index it was copied from (lifetime leaderboards only), and `pages`
+  memoizes the rendered pages, which only depend on the snapshot.
+  """
+
+  guild_id: int
+  version: int
+  ids: tuple[int, ...]
+  xps: tuple[int, ...]
+  source: RankIndex | None = field(compare=False, repr=False)
+  period: Period = Period.ALL
+  built_at: float = field(default_factory=time.monotonic, compare=False, repr=False)
+  pages: dict[int, str] = field(default_factory=dict, compare=False, repr=False)
+
+  def __len__(self) -> int:
+    return len(self.ids)
+
+  def page(self, start: int, count: int) -> list[ExportUserEntry]:
+    """Returns `count` users starting from the 0-based position `start`"""
+    return [
+      ExportUserEntry(id=user_id, xp=xp)
+      for user_id, xp in zip(self.ids[start:start + count], self.xps[start:start + count])
+    ]
+
+
+class LeaderboardSnapshots:
+  """
+  ## Description
+  Per guild and period leaderboard snapshots, built once for all concurrent viewers.\\
+  A lifetime snapshot is served until its rank index went through more than `staleness` changes
+  or changed at all once it is `max_age` seconds old, and for at least `min_age` seconds as
+  each build copies the whole index ; a windowed one (summed from the daily buckets) for
+  `period_ttl` seconds. Concurrent requests for a snapshot being built wait for that single build.
+  """
+
+  def __init__(self,
+               db: UsefulDatabase,
+               staleness: int = LEADERBOARD_STALENESS,
+               period_ttl: float = LEADERBOARD_PERIOD_TTL,
+               min_age: float = LEADERBOARD_MIN_AGE,
+               max_age: float = LEADERBOARD_MAX_AGE):
+    self.__db = db
+    self.staleness = staleness
+    self.min_age = min_age
+    self.max_age = max_age
+    self.period_ttl = period_ttl
+    self.__snapshots: dict[tuple[int, Period], LeaderboardSnapshot] = {}
+    self.__building: dict[tuple[int, Period], asyncio.Task] = {}
+
+    self.log = logging.getLogger('resistance.leaderboard')
+
+  def __fresh(self, snapshot: LeaderboardSnapshot | None) -> bool:
+    if snapshot is None:
+      return False
+    age = time.monotonic() - snapshot.built_at
+    if snapshot.period is not Period.ALL:
+      return age <= self.period_ttl
+    ranks = self.__db.ranks(snapshot.guild_id)
+    if snapshot.source is not ranks:
+      return False
+    if (changes := ranks.version - snapshot.version) == 0 or age < self.min_age:
+      return True
+    return changes <= self.staleness and age < self.max_age
+
+  async def get(self, guild_id: int, period: Period = Period.ALL) -> LeaderboardSnapshot:
+    """Returns a recent enough snapshot of a guild leaderboard"""
+    key = (guild_id, period)
+    if self.__fresh(snapshot := self.__snapshots.get(key)):
+      return snapshot
+    if (build := self.__building.get(key)) is None:
+      build = self.__building[key] = asyncio.create_task(self.__build(guild_id, period))
+      build.add_done_callback(lambda _: self.__building.pop(key, None))
+    return await asyncio.shield(build) # a cancelled viewer does not cancel the others
+
+  async def __build(self, guild_id: int, period: Period) -> LeaderboardSnapshot:
+    if period is not Period.ALL:
+      entries = await self.__db.period_users(guild_id, period)
+      snapshot = self.__snapshots[(guild_id, period)] = LeaderboardSnapshot(
+        guild_id,
+        0,
+        tuple(entry.id for entry in entries),
+        tuple(entry.xp for entry in entries),
+        None,
+        period,
+      )
+      return snapshot
+    # the ranks of a guild joined after startup are loaded on demand
+    if not (ranks := self.__db.ranks(guild_id)).loaded:
+      await self.__db.load_ranks([guild_id])
+      ranks = self.__db.ranks(guild_id)
+    entries = ranks.page(0, len(ranks))
+    snapshot = LeaderboardSnapshot(
+      guild_id,
+      ranks.version,
+      tuple(entry.id for entry in entries),
+      tuple(entry.xp for entry in entries),
+      ranks,
+    )
+    self.__snapshots[(guild_id, period)] = snapshot
+    self.log.debug('Built leaderboard of guild %d (%d members, version %d)', guild_id, len(snapshot),
+                   ranks.version)
+    return snapshot
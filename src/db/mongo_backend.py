@@ -0,0 +1,339 @@
+import os
+
+import logging
+from typing import Any
+from typing_extensions import override
+
+from pymongo import ASCENDING, DESCENDING, DeleteOne, IndexModel, MongoClient, ReturnDocument, UpdateOne
+from pymongo.collection import Collection
+from pymongo.cursor import Cursor
+from pymongo.errors import PyMongoError
+
+from .backend import *
+from .backend import DB_BATCH_SIZE, bucket_day, split_xp
+
+__all__ = ['MongoBackend', 'HAS_MONGO_CREDENTIALS']
+
+DB_USER = os.getenv('DB_USER', '')
+DB_PASSWD = os.getenv('DB_PASSWD', '')
+DB_URL = os.getenv('DB_URL', '')
+DB_PORT = os.getenv('DB_PORT', None)
+CONNECTION_STRING = f'mongodb+srv://{DB_USER}:{DB_PASSWD}@{DB_URL}/?retryWrites=true&w=majority'
+HAS_MONGO_CREDENTIALS = DB_USER != '' and DB_PASSWD != ''
+# a single client is kept for the whole run, its pool only needs to cover the database workers
+CLIENT_OPTIONS: dict[str, Any] = {
+  'maxPoolSize': int(os.getenv('DB_POOL_SIZE', '10')),
+  'minPoolSize': int(os.getenv('DB_MIN_POOL_SIZE', '1')),
+  'connectTimeoutMS': int(os.getenv('DB_TIMEOUT_MS', '10000')),
+  'socketTimeoutMS': int(os.getenv('DB_TIMEOUT_MS', '10000')),
+  'serverSelectionTimeoutMS': int(os.getenv('DB_SERVER_SELECTION_TIMEOUT_MS', '10000')),
+}
+
+# collection property -> indexes the hot queries on that collection rely on
+# (the config collection only holds a single document and is always read whole)
+INDEXES: dict[str, list[IndexModel]] = {
+  'users_collection': [
+    IndexModel([('id_guild', ASCENDING), ('id_user', ASCENDING)], name='guild_user_unique', unique=True),
+    IndexModel([('id_guild', ASCENDING), ('XP', DESCENDING)], name='guild_xp_desc'),
+  ],
+  'tasks_collection': [IndexModel([('state', ASCENDING)], name='state')],
+}
+# indexes of the global (pre guild) layout, a unique `id_user` would forbid per guild records
+OBSOLETE_INDEXES: dict[str, list[list[tuple[str, int]]]] = {
+  'users_collection': [[('id_user', ASCENDING)], [('XP', DESCENDING)]],
+}
+# records stored before XP was split per guild
+LEGACY_FILTER = {'id_guild': {'$exists': False}}
+# bulk reads only need these fields, leaving `_id`, `name_user` and `days` on the server
+USER_PROJECTION = {'_id': False, 'id_user': True, 'XP': True}
+
+
+def days_since(first_day: int) -> dict[str, Any]:
+  """Aggregation expression keeping the `days` buckets (`'<day>': xp`) of `first_day` and after"""
+  return {
+    '$filter': {
+      'input': {
+        '$objectToArray': '$days'
+      },
+      'cond': {
+        '$gte': [{
+          '$toInt': '$$this.k'
+        }, first_day]
+      }
+    }
+  }
+
+
+def plan_stages(plan: dict[str, Any]) -> set[str]:
+  """Collects every stage name of an `explain` winning plan"""
+  stages = {plan['stage']} if 'stage' in plan else set()
+  for value in plan.values():
+    children = value if isinstance(value, list) else [value]
+    for child in children:
+      if isinstance(child, dict):
+        stages |= plan_stages(child)
+  return stages
+
+
+class MongoBackend(StorageBackend):
+  """
+  ## Description
+  MongoDB (Atlas) storage.\\
+  Daily XP buckets are kept in the `days` sub-document of each member (`{'<day>': xp}`),
+  incremented by the same update as its total.
+  """
+
+  name = 'mongo'
+
+  def __init__(self, connection_string: str = CONNECTION_STRING, port: int | None = None, **options: Any):
+    self.__client: MongoClient = None
+    self.__connection_string = connection_string
+    self.__port = port if port is not None else int(DB_PORT) if DB_PORT else None
+    self.__options = {**CLIENT_OPTIONS, **options}
+    self.log = logging.getLogger('resistance.mongo')
+
+  @property
+  def client(self) -> MongoClient:
+    return self.__client
+
+  @property
+  @override
+  def connected(self) -> bool:
+    return self.__client is not None
+
+  @property
+  def users_collection(self) -> Collection:
+    return self.client.BDMFR.Utilisateurs
+
+  @property
+  def tasks_collection(self) -> Collection:
+    return self.client.Resistance.Tasks
+
+  @property
+  def config_collection(self) -> Collection:
+    return self.client.Resistance.Config
+
+  @override
+  def connect(self) -> bool:
+    if self.__client is None:
+      self.__client = MongoClient(self.__connection_string, port=self.__port, **self.__options)
+    return True
+
+  @override
+  def disconnect(self) -> bool:
+    if self.__client is None:
+      return False
+    self.__client.close()
+    self.__client = None
+    return True
+
+  @override
+  def test(self) -> None:
+    # also opens the first pooled connection, so the first real query does not pay for it
+    if (reply := self.client.admin.command('ping')).get('ok') != 1:
+      raise PyMongoError(f'Unexpected ping reply: {reply}')
+
+  @override
+  def ensure_indexes(self) -> list[str]:
+    created: list[str] = []
+    for collection_name, indexes in INDEXES.items():
+      collection: Collection = getattr(self, collection_name)
+      try:
+        info = collection.index_information()
+        obsolete = OBSOLETE_INDEXES.get(collection_name, [])
+        for name in [name for name, i in info.items() if i['key'] in obsolete]:
+          collection.drop_index(name)
+          self.log.info('Dropped obsolete index %s on %s', name, collection.full_name)
+        existing = [i['key'] for i in info.values()]
+        if missing := [index for index in indexes if list(index.document['key'].items()) not in existing]:
+          created += collection.create_indexes(missing)
+          self.log.info('Created indexes %s on %s', ', '.join(created[-len(missing):]), collection.full_name)
+      except PyMongoError as e:
+        self.log.error('Could not create indexes on %s: %s', collection.full_name, e)
+    return created
+
+  def __hot_queries(self) -> dict[str, Cursor]:
+    return {
+      'user lookup': self.users_collection.find({
+        'id_guild': 0,
+        'id_user': 0
+      }),
+      'top users': self.users_collection.find({
+        'id_guild': 0
+      }).sort('XP', -1).limit(10),
+      'enabled events': self.tasks_collection.find({'state': True}),
+    }
+
+  @override
+  def check_query_plans(self) -> list[str]:
+    scans: list[str] = []
+    for name, cursor in self.__hot_queries().items():
+      try:
+        plan = cursor.explain()['queryPlanner']['winningPlan']
+      except PyMongoError as e:
+        self.log.error('Could not explain query \'%s\': %s', name, e)
+        continue
+      if 'COLLSCAN' in plan_stages(plan):
+        scans.append(name)
+    return scans
+
+  def __get_user_entry(self, guild_id: int, user_id: int) -> dict:
+    return self.users_collection.find_one(self.__member(guild_id, user_id))
+
+  @staticmethod
+  def __member(guild_id: int, user_id: int) -> dict[str, int]:
+    return {'id_guild': guild_id, 'id_user': user_id}
+
+  @staticmethod
+  def __inc(username: str, amount: int, day: int | None = None) -> dict[str, dict]:
+    # no bucket for the legacy XP nor the days already compacted
+    inc = {'XP': amount} if day is None else {'XP': amount, f'days.{day}': amount}
+    return {'$inc': inc, '$setOnInsert': {'name_user': username}}
+
+  @override
+  def add_xp_to_user(self,
+                     guild_id: int,
+                     user_id: int,
+                     username: str,
+                     amount: int,
+                     day: int | None = None) -> int:
+    # a single `find_one_and_update` round trip, so concurrent increments are never lost
+    day = bucket_day(day)
+    entry = self.users_collection.find_one_and_update(
+      self.__member(guild_id, user_id),
+      self.__inc(username, amount, day),
+      projection={
+        '_id': False,
+        'XP': True
+      },
+      upsert=True,
+      return_document=ReturnDocument.BEFORE,
+    )
+    return entry['XP'] if entry is not None else 0 # no pre-image when the user was just created
+
+  @override
+  def bulk_add_xp(self, deltas: dict[tuple[int, int], tuple[str, int]], day: int | None = None) -> int:
+    if not deltas:
+      return 0
+    day = bucket_day(day)
+    requests = [
+      UpdateOne(self.__member(guild_id, user_id), self.__inc(username, amount, day), upsert=True)
+      for (guild_id, user_id), (username, amount) in deltas.items()
+    ]
+    r = self.users_collection.bulk_write(requests, ordered=False)
+    return r.modified_count + r.upserted_count
+
+  @override
+  def period_users(self, guild_id: int, first_day: int) -> list[ExportUserEntry]:
+    cursor = self.users_collection.aggregate([
+      {
+        '$match': {
+          'id_guild': guild_id,
+          'days': {
+            '$exists': True
+          }
+        }
+      },
+      {
+        '$project': {
+          '_id': False,
+          'id_user': True,
+          'XP': {
+            '$sum': {
+              '$map': {
+                'input': days_since(first_day),
+                'in': '$$this.v'
+              }
+            }
+          }
+        }
+      },
+      {
+        '$match': {
+          'XP': {
+            '$gt': 0
+          }
+        }
+      },
+      {
+        '$sort': {
+          'XP': -1
+        }
+      },
+    ])
+    return [ExportUserEntry(id=entry['id_user'], xp=entry['XP']) for entry in cursor]
+
+  @override
+  def compact_days(self, first_day: int) -> int:
+    # pipeline update : the buckets to drop depend on the keys of each document
+    r = self.users_collection.update_many(
+      {'days': {
+        '$exists': True
+      }},
+      [{
+        '$set': {
+          'days': {
+            '$arrayToObject': days_since(first_day)
+          }
+        }
+      }],
+    )
+    return r.modified_count
+
+  @override
+  def get_user_xp(self, guild_id: int, user_id: int) -> int:
+    # BDMFR -> Utilisateurs -> {id_guild, id_user, XP}
+    entry = self.__get_user_entry(guild_id, user_id)
+    return entry['XP'] if entry is not None else -1
+
+  def __find_users(self, guild_id: int, batch_size: int) -> Cursor:
+    return self.users_collection.find({'id_guild': guild_id}, USER_PROJECTION, batch_size=batch_size)
+
+  @override
+  def users(self, guild_id: int, batch_size: int = DB_BATCH_SIZE) -> list[ExportUserEntry]:
+    return [
+      ExportUserEntry(id=entry['id_user'], xp=entry['XP'])
+      for entry in self.__find_users(guild_id, batch_size)
+    ]
+
+  @override
+  def user_columns(self, guild_id: int, batch_size: int = DB_BATCH_SIZE) -> UserColumns:
+    columns = UserColumns()
+    for entry in self.__find_users(guild_id, batch_size):
+      columns.append(entry['id_user'], entry['XP'])
+    return columns
+
+  @override
+  def top_users(self, guild_id: int, n: int) -> list[ExportUserEntry]:
+    cursor = self.users_collection.find({'id_guild': guild_id}, USER_PROJECTION).sort('XP', -1).limit(n)
+    return [ExportUserEntry(id=entry['id_user'], xp=entry['XP']) for entry in cursor]
+
+  @override
+  def legacy_user_ids(self) -> list[int]:
+    return [entry['id_user'] for entry in self.users_collection.find(LEGACY_FILTER, {'id_user': True})]
+
+  @override
+  def migrate_legacy_users(self, assignments: dict[int, list[int]]) -> int:
+    requests: list[UpdateOne | DeleteOne] = []
+    for entry in self.users_collection.find({**LEGACY_FILTER, 'id_user': {'$in': list(assignments)}}):
+      guild_ids = assignments[entry['id_user']]
+      requests += [
+        UpdateOne(
+          self.__member(guild_id, entry['id_user']),
+          self.__inc(entry.get('name_user', ''), share),
+          upsert=True,
+        ) for guild_id, share in zip(guild_ids, split_xp(entry['XP'], len(guild_ids)))
+      ]
+      # ordered : the legacy record only goes away once its XP has been copied
+      requests.append(DeleteOne({'_id': entry['_id']}))
+    if not requests:
+      return 0
+    return self.users_collection.bulk_write(requests, ordered=True).deleted_count
+
+  @override
+  def get_config(self) -> list[dict[str, Any]]:
+    return list(self.config_collection.find())
+
+  @override
+  def get_events(self) -> list[dict[str, Any]]:
+    return list(self.tasks_collection.find({'state': True}))
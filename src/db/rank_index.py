@@ -0,0 +1,110 @@
+from collections.abc import Iterable
+from dataclasses import dataclass
+
+from sortedcontainers import SortedList
+
+from .backend import ExportUserEntry, UserColumns
+
+__all__ = ['RankIndex', 'UserRank']
+
+
+@dataclass(slots=True)
+class UserRank:
+  """
+  ## Description
+  The position of a member in the leaderboard of a guild.
+  """
+
+  rank: int                     # 1-based
+  total: int
+  xp: int
+  above: ExportUserEntry | None # the member ranked just before, None for the first one
+
+  @property
+  def gap(self) -> int:
+    """XP to earn to catch up with the member ranked just before"""
+    return self.above.xp - self.xp if self.above is not None else 0
+
+
+class RankIndex:
+  """
+  ## Description
+  In-memory leaderboard kept sorted by decreasing XP (ties broken by user id).\\
+  Built once from the stored users and updated on every XP increment, so that
+  ranks and leaderboard pages cost `O(log n)` and `O(log n + page size)`.
+
+  `version` counts the changes, for the readers that keep a copy (see `LeaderboardSnapshots`).
+  """
+
+  def __init__(self) -> None:
+    self.__xp: dict[int, int] = {}
+    self.__sorted: SortedList = SortedList() # of (-xp, user_id)
+    self.loaded = False
+    self.version = 0
+
+  def __len__(self) -> int:
+    return len(self.__xp)
+
+  def __contains__(self, user_id: int) -> bool:
+    return user_id in self.__xp
+
+  def load(self, entries: Iterable[ExportUserEntry]) -> None:
+    """Adds the stored users, keeping the totals that were updated in the meantime"""
+    self.__load((-entry.xp, entry.id) for entry in entries)
+
+  def load_columns(self, columns: UserColumns) -> None:
+    """Same as `load` from the parallel arrays of a bulk scan"""
+    self.__load((-xp, user_id) for user_id, xp in columns)
+
+  def __load(self, keys: Iterable[tuple[int, int]]) -> None:
+    fresh = [key for key in keys if key[1] not in self.__xp]
+    for key in fresh:
+      self.__xp[key[1]] = -key[0]
+    self.__sorted.update(fresh)
+    self.loaded = True
+    self.version += 1
+
+  def update(self, user_id: int, xp: int) -> None:
+    """Sets the XP total of a user"""
+    if (old_xp := self.__xp.get(user_id)) is not None:
+      if old_xp == xp:
+        return
+      self.__sorted.remove((-old_xp, user_id))
+    self.__xp[user_id] = xp
+    self.__sorted.add((-xp, user_id))
+    self.version += 1
+
+  def remove(self, user_id: int) -> None:
+    if (old_xp := self.__xp.pop(user_id, None)) is not None:
+      self.__sorted.remove((-old_xp, user_id))
+      self.version += 1
+
+  def xp_of(self, user_id: int) -> int:
+    """Returns the XP of a user or -1 if the user is not ranked"""
+    return self.__xp.get(user_id, -1)
+
+  def rank_of(self, user_id: int) -> int:
+    """Returns the 1-based rank of a user or 0 if the user is not ranked"""
+    if (xp := self.__xp.get(user_id)) is None:
+      return 0
+    return self.__sorted.bisect_left((-xp, user_id)) + 1
+
+  def user_rank(self, user_id: int) -> UserRank | None:
+    """Returns the rank of a user and the user just before, in `O(log n)`"""
+    if not (rank := self.rank_of(user_id)):
+      return None
+    return UserRank(rank, len(self), self.__xp[user_id], self.at(rank - 1))
+
+  def at(self, rank: int) -> ExportUserEntry | None:
+    """Returns the user at a given 1-based rank"""
+    if not 1 <= rank <= len(self.__sorted):
+      return None
+    neg_xp, user_id = self.__sorted[rank - 1]
+    return ExportUserEntry(id=user_id, xp=-neg_xp)
+
+  def page(self, start: int, count: int) -> list[ExportUserEntry]:
+    """Returns `count` users starting from the 0-based position `start`"""
+    return [
+      ExportUserEntry(id=user_id, xp=-neg_xp)
+      for neg_xp, user_id in self.__sorted.islice(start, start + count)
+    ]
@@ -0,0 +1,258 @@
+import os
+
+import json
+import logging
+import sqlite3
+import threading
+from collections.abc import Iterator
+from typing import Any
+from typing_extensions import override
+
+from .backend import *
+from .backend import DB_BATCH_SIZE, bucket_day, split_xp
+
+__all__ = ['SqliteBackend']
+
+DB_PATH = os.getenv('DB_PATH', 'data/resistance.sqlite3')
+
+# tasks and config are stored as JSON documents, with the queried fields extracted as generated columns
+# (the `users` table of the global, pre guild, layout is only read by the migration)
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS guild_users (
+  id_guild  INTEGER NOT NULL,
+  id_user   INTEGER NOT NULL,
+  name_user TEXT    NOT NULL DEFAULT '',
+  xp        INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (id_guild, id_user)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS guild_user_days (
+  id_guild INTEGER NOT NULL,
+  day      INTEGER NOT NULL,
+  id_user  INTEGER NOT NULL,
+  xp       INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (id_guild, day, id_user)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS tasks (
+  id    INTEGER PRIMARY KEY,
+  doc   TEXT NOT NULL,
+  state INTEGER GENERATED ALWAYS AS (json_extract(doc, '$.state')) VIRTUAL
+);
+CREATE TABLE IF NOT EXISTS config (
+  id  INTEGER PRIMARY KEY,
+  doc TEXT NOT NULL
+);
+'''
+
+INDEXES: dict[str, str] = {
+  'guild_users_xp_desc': 'CREATE INDEX IF NOT EXISTS guild_users_xp_desc ON guild_users (id_guild, xp DESC)',
+  'tasks_state': 'CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state)',
+}
+
+UPSERT = 'INSERT INTO guild_users (id_guild, id_user, name_user, xp) VALUES (?, ?, ?, ?) '\
+         'ON CONFLICT (id_guild, id_user) DO UPDATE SET xp = xp + excluded.xp'
+
+DAY_UPSERT = 'INSERT INTO guild_user_days (id_guild, day, id_user, xp) VALUES (?, ?, ?, ?) '\
+             'ON CONFLICT (id_guild, day, id_user) DO UPDATE SET xp = xp + excluded.xp'
+
+USERS_QUERY = 'SELECT id_user, xp FROM guild_users WHERE id_guild = ?'
+PERIOD_USERS_QUERY = 'SELECT id_user, SUM(xp) AS total FROM guild_user_days WHERE id_guild = ? AND day >= ? '\
+                     'GROUP BY id_user ORDER BY total DESC'
+
+HOT_QUERIES: dict[str, str] = {
+  'user lookup': 'SELECT xp FROM guild_users WHERE id_guild = 0 AND id_user = 0',
+  'top users': 'SELECT id_user, xp FROM guild_users WHERE id_guild = 0 ORDER BY xp DESC LIMIT 10',
+  'period users': PERIOD_USERS_QUERY.replace('?', '0'),
+  'enabled events': 'SELECT doc FROM tasks WHERE state = 1',
+}
+
+
+class SqliteBackend(StorageBackend):
+  """
+  ## Description
+  Embedded SQLite storage (WAL mode), for small deployments, tests and benchmarks.\\
+  Use `':memory:'` as path for a throwaway in-memory database.
+
+  Daily XP buckets are rows of `guild_user_days`, written in the same transaction as the totals.
+  """
+
+  name = 'sqlite'
+
+  def __init__(self, path: str = DB_PATH):
+    self.path = path
+    self.__conn: sqlite3.Connection = None
+    self.__lock = threading.Lock() # one connection shared by the worker pool
+    self.log = logging.getLogger('resistance.sqlite')
+
+  @property
+  @override
+  def connected(self) -> bool:
+    return self.__conn is not None
+
+  def __execute(self, sql: str, params: tuple = ()) -> list[tuple]:
+    with self.__lock, self.__conn:
+      return self.__conn.execute(sql, params).fetchall()
+
+  @override
+  def connect(self) -> bool:
+    if self.__conn is not None:
+      return True
+    if self.path != ':memory:' and (directory := os.path.dirname(self.path)):
+      os.makedirs(directory, exist_ok=True)
+    self.__conn = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False, isolation_level=None)
+    self.__conn.execute('PRAGMA journal_mode = WAL')
+    self.__conn.execute('PRAGMA synchronous = NORMAL')
+    self.__conn.executescript(SCHEMA)
+    return True
+
+  @override
+  def disconnect(self) -> bool:
+    if self.__conn is None:
+      return False
+    with self.__lock:
+      self.__conn.close()
+      self.__conn = None
+    return True
+
+  @override
+  def test(self) -> None:
+    if (rows := self.__execute('SELECT 1')) != [(1,)]:
+      raise sqlite3.DatabaseError(f'Unexpected test query result: {rows}')
+
+  @override
+  def ensure_indexes(self) -> list[str]:
+    existing = {name for name, in self.__execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    created = [name for name in INDEXES if name not in existing]
+    for name in created:
+      self.__execute(INDEXES[name])
+    if created:
+      self.log.info('Created indexes %s', ', '.join(created))
+    return created
+
+  @override
+  def check_query_plans(self) -> list[str]:
+    scans: list[str] = []
+    for name, sql in HOT_QUERIES.items():
+      details = [row[-1] for row in self.__execute(f'EXPLAIN QUERY PLAN {sql}')]
+      if any(d.startswith('SCAN') and 'USING' not in d for d in details):
+        scans.append(name)
+    return scans
+
+  @override
+  def add_xp_to_user(self,
+                     guild_id: int,
+                     user_id: int,
+                     username: str,
+                     amount: int,
+                     day: int | None = None) -> int:
+    with self.__lock, self.__conn:
+      self.__conn.execute('BEGIN')
+      xp, = self.__conn.execute(f'{UPSERT} RETURNING xp', (guild_id, user_id, username, amount)).fetchone()
+      if (day := bucket_day(day)) is not None:
+        self.__conn.execute(DAY_UPSERT, (guild_id, day, user_id, amount))
+    return xp - amount
+
+  @override
+  def bulk_add_xp(self, deltas: dict[tuple[int, int], tuple[str, int]], day: int | None = None) -> int:
+    if not deltas:
+      return 0
+    day = bucket_day(day)
+    with self.__lock, self.__conn:
+      self.__conn.execute('BEGIN')
+      self.__conn.executemany(
+        UPSERT,
+        ((guild_id, user_id, username, amount) for (guild_id, user_id), (username, amount) in deltas.items()),
+      )
+      if day is not None:
+        self.__conn.executemany(
+          DAY_UPSERT,
+          ((guild_id, day, user_id, amount) for (guild_id, user_id), (_, amount) in deltas.items()),
+        )
+    return len(deltas)
+
+  @override
+  def period_users(self, guild_id: int, first_day: int) -> list[ExportUserEntry]:
+    return [
+      ExportUserEntry(id=id_user, xp=xp)
+      for id_user, xp in self.__execute(PERIOD_USERS_QUERY, (guild_id, first_day))
+    ]
+
+  @override
+  def compact_days(self, first_day: int) -> int:
+    with self.__lock, self.__conn:
+      return self.__conn.execute('DELETE FROM guild_user_days WHERE day < ?', (first_day,)).rowcount
+
+  @override
+  def get_user_xp(self, guild_id: int, user_id: int) -> int:
+    rows = self.__execute('SELECT xp FROM guild_users WHERE id_guild = ? AND id_user = ?',
+                          (guild_id, user_id))
+    return rows[0][0] if rows else -1
+
+  def __stream(self, sql: str, params: tuple, batch_size: int) -> Iterator[list[tuple]]:
+    # each batch is fetched under the lock, released while the caller consumes it
+    with self.__lock:
+      cursor = self.__conn.execute(sql, params)
+    try:
+      while True:
+        with self.__lock:
+          batch = cursor.fetchmany(batch_size)
+        if not batch:
+          return
+        yield batch
+    finally:
+      with self.__lock:
+        cursor.close()
+
+  @override
+  def users(self, guild_id: int, batch_size: int = DB_BATCH_SIZE) -> list[ExportUserEntry]:
+    return [
+      ExportUserEntry(id=id_user, xp=xp)
+      for batch in self.__stream(USERS_QUERY, (guild_id,), batch_size)
+      for id_user, xp in batch
+    ]
+
+  @override
+  def user_columns(self, guild_id: int, batch_size: int = DB_BATCH_SIZE) -> UserColumns:
+    columns = UserColumns()
+    for batch in self.__stream(USERS_QUERY, (guild_id,), batch_size):
+      for id_user, xp in batch:
+        columns.append(id_user, xp)
+    return columns
+
+  @override
+  def top_users(self, guild_id: int, n: int) -> list[ExportUserEntry]:
+    rows = self.__execute('SELECT id_user, xp FROM guild_users WHERE id_guild = ? ORDER BY xp DESC LIMIT ?',
+                          (guild_id, n))
+    return [ExportUserEntry(id=id_user, xp=xp) for id_user, xp in rows]
+
+  def __has_legacy_table(self) -> bool:
+    return bool(self.__execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'users'"))
+
+  @override
+  def legacy_user_ids(self) -> list[int]:
+    if not self.__has_legacy_table():
+      return []
+    return [id_user for id_user, in self.__execute('SELECT id_user FROM users')]
+
+  @override
+  def migrate_legacy_users(self, assignments: dict[int, list[int]]) -> int:
+    if not assignments or not self.__has_legacy_table():
+      return 0
+    with self.__lock, self.__conn:
+      self.__conn.execute('BEGIN')
+      legacy = self.__conn.execute('SELECT id_user, name_user, xp FROM users').fetchall()
+      self.__conn.executemany(
+        UPSERT,
+        ((guild_id, id_user, name_user, share)
+         for id_user, name_user, xp in legacy if (guild_ids := assignments.get(id_user))
+         for guild_id, share in zip(guild_ids, split_xp(xp, len(guild_ids)))),
+      )
+      return self.__conn.executemany('DELETE FROM users WHERE id_user = ?',
+                                     ((user_id,) for user_id in assignments)).rowcount
+
+  @override
+  def get_config(self) -> list[dict[str, Any]]:
+    return [json.loads(doc) for doc, in self.__execute('SELECT doc FROM config ORDER BY id')]
+
+  @override
+  def get_events(self) -> list[dict[str, Any]]:
+    return [json.loads(doc) for doc, in self.__execute('SELECT doc FROM tasks WHERE state = 1')]
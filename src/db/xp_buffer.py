@@ -0,0 +1,223 @@
+import os
+
+import asyncio
+import contextlib
+import logging
+import time
+from collections.abc import AsyncIterator
+from discord.ext import tasks
+
+from .backend import xp_day
+from .database import UsefulDatabase
+
+__all__ = ['XpBuffer']
+
+XP_FLUSH_INTERVAL = float(os.getenv('XP_FLUSH_INTERVAL', '30'))
+XP_FLUSH_SIZE = int(os.getenv('XP_FLUSH_SIZE', '500'))
+XP_TOTALS_SIZE = int(os.getenv('XP_TOTALS_SIZE', '10000'))
+XP_TOTALS_TTL = float(os.getenv('XP_TOTALS_TTL', '3600'))
+
+
+class XpBuffer:
+  """
+  ## Description
+  Write-behind accumulator for XP increments.\\
+  Increments are coalesced per guild member in memory and written with a single bulk upsert
+  every `interval` seconds, or as soon as `max_pending` users are waiting to be flushed.
+  The first increment of a user goes straight to the database with an atomic upsert,
+  which also returns the stored total ; the running totals are then kept so that level
+  ups can be computed without reading back from the database. Totals of members without
+  pending XP are evicted after `totals_ttl` idle seconds, or beyond `max_totals` members,
+  and seeded again by the atomic upsert of their next increment.
+  """
+
+  def __init__(
+    self,
+    db: UsefulDatabase,
+    interval: float = XP_FLUSH_INTERVAL,
+    max_pending: int = XP_FLUSH_SIZE,
+    max_totals: int = XP_TOTALS_SIZE,
+    totals_ttl: float = XP_TOTALS_TTL,
+  ):
+    self.__db = db
+    # all keyed by (guild_id, user_id)
+    self.__totals: dict[tuple[int, int], int] = {}
+    self.__seen: dict[tuple[int, int], float] = {} # last update of each total, least recent first
+    self.__pending: dict[tuple[int, int], tuple[str, int]] = {}
+    self.__loading: dict[tuple[int, int], asyncio.Event] = {}
+    self.__open = asyncio.Event()                  # cleared while paused
+    self.__open.set()
+    self.max_pending = max_pending
+    self.max_totals = max_totals
+    self.totals_ttl = totals_ttl
+
+    self.log = logging.getLogger('resistance.xp')
+    self.run.change_interval(seconds=interval)
+
+  @property
+  def n_pending(self) -> int:
+    return len(self.__pending)
+
+  @property
+  def n_totals(self) -> int:
+    return len(self.__totals)
+
+  def __set_total(self, key: tuple[int, int], total: int) -> None:
+    self.__totals[key] = total
+    self.__seen.pop(key, None)
+    self.__seen[key] = time.monotonic()
+
+  def __publish(self, key: tuple[int, int]) -> None:
+    """Makes the buffered total of a member visible to the XP lookups and ranks"""
+    self.__db.cache_user_xp(*key, self.__totals[key])
+    self.__db.ranks(key[0]).update(key[1], self.__totals[key])
+
+  async def add(self, guild_id: int, user_id: int, username: str, amount: int) -> int:
+    """Buffers an XP increment and returns the member XP before it"""
+    await self.__open.wait()
+    key = (guild_id, user_id)
+    while (loading := self.__loading.get(key)) is not None:
+      await loading.wait() # the first increment of this member is still in flight
+
+    if key not in self.__totals:
+      self.__loading[key] = loading = asyncio.Event()
+      try:
+        old_xp = await self.__db.add_xp_to_user(guild_id, user_id, username, amount)
+        self.__set_total(key, old_xp + amount)
+      finally:
+        del self.__loading[key]
+        loading.set()
+      return old_xp
+
+    old_xp = self.__totals[key]
+    self.__set_total(key, old_xp + amount)
+    self.__publish(key)
+    _, pending = self.__pending.get(key, (username, 0))
+    self.__pending[key] = (username, pending + amount)
+
+    if len(self.__pending) >= self.max_pending:
+      await self.flush()
+    return old_xp
+
+  async def add_many(self, deltas: dict[tuple[int, int], tuple[str, int]], day: int | None = None) -> None:
+    """
+    Buffers many increments at once (e.g. a history backfill), earned on `day` (today by default).\\
+    Members whose total is already known are buffered as usual ; the others are written
+    right away with a single bulk upsert, as they have no total to add the increment to.
+    XP of a past day is written right away too, in the bucket of that day.
+    """
+    await self.__open.wait()
+    while loadings := {self.__loading[key] for key in deltas if key in self.__loading}:
+      for loading in loadings:
+        await loading.wait()
+
+    past = day is not None and day != xp_day()
+    unknown = {key for key in deltas if key not in self.__totals}
+    direct = deltas if past else {key: deltas[key] for key in unknown}
+    for key, (username, amount) in deltas.items():
+      if key in unknown:
+        continue
+      self.__set_total(key, self.__totals[key] + amount)
+      self.__publish(key)
+      if not past:
+        _, pending = self.__pending.get(key, (username, 0))
+        self.__pending[key] = (username, pending + amount)
+
+    if direct:
+      # live increments of these members wait for the bulk write, like after a first increment
+      loading = asyncio.Event()
+      self.__loading.update(dict.fromkeys(direct, loading))
+      try:
+        await self.__db.bulk_add_xp(direct, day)
+        for guild_id, user_id in unknown:
+          _, amount = deltas[(guild_id, user_id)]
+          if (ranks := self.__db.ranks(guild_id)).loaded:
+            ranks.update(user_id, max(ranks.xp_of(user_id), 0) + amount)
+      finally:
+        for key in direct:
+          del self.__loading[key]
+        loading.set()
+
+    if len(self.__pending) >= self.max_pending:
+      await self.flush()
+
+  def forget(self) -> None:
+    """Drops the known totals so that they are read again on the next increment (flush first)"""
+    self.__totals.clear()
+    self.__seen.clear()
+
+  @contextlib.asynccontextmanager
+  async def paused(self) -> AsyncIterator[None]:
+    """
+    Holds new increments back and writes the pending ones, while the stored XP is rewritten
+    (e.g. by a migration) ; the totals are forgotten before increments resume.
+    """
+    self.__open.clear()
+    try:
+      while loadings := set(self.__loading.values()):
+        for loading in loadings:
+          await loading.wait()
+      await self.flush()
+      if self.__pending: # kept for a retry : forgetting their totals would lose them
+        raise RuntimeError(f'Could not flush the XP of {len(self.__pending)} members')
+      try:
+        yield
+      finally:
+        self.forget()
+    finally:
+      self.__open.set()
+
+  def evict(self) -> int:
+    """Drops the totals idle for `totals_ttl` seconds or beyond `max_totals`, and returns their number"""
+    deadline = time.monotonic() - self.totals_ttl
+    n_over = len(self.__totals) - self.max_totals
+    evicted = 0
+    for key, seen in list(self.__seen.items()):
+      if seen > deadline and evicted >= n_over:
+        break
+      if key in self.__pending or key in self.__loading: # the database does not hold this total yet
+        continue
+      del self.__totals[key], self.__seen[key]
+      evicted += 1
+    return evicted
+
+  def __take(self) -> dict[tuple[int, int], tuple[str, int]]:
+    pending, self.__pending = self.__pending, {}
+    return pending
+
+  def __restore(self, pending: dict[tuple[int, int], tuple[str, int]]) -> None:
+    for key, (username, amount) in pending.items():
+      _, newer = self.__pending.get(key, (username, 0))
+      self.__pending[key] = (username, amount + newer)
+
+  async def flush(self) -> int:
+    """Writes every pending increment and returns the number of flushed members"""
+    if not (pending := self.__take()):
+      return 0
+    try:
+      await self.__db.bulk_add_xp(pending)
+    except Exception as e:                            # pylint: disable=broad-except
+      self.__restore(pending)
+      self.log.error('Could not flush XP of %d members: %s', len(pending), e)
+      return 0
+    for key in pending.keys() & self.__totals.keys(): # the write dropped them from the cache
+      self.__publish(key)
+    self.log.debug('Flushed XP of %d members', len(pending))
+    return len(pending)
+
+  def flush_blocking(self) -> int:
+    """Same as `flush` but without the event loop (used on shutdown)"""
+    if not (pending := self.__take()):
+      return 0
+    self.__db.backend.bulk_add_xp(pending)
+    self.log.info('Flushed XP of %d members', len(pending))
+    return len(pending)
+
+  @tasks.loop(seconds=XP_FLUSH_INTERVAL)
+  async def run(self) -> None:
+    """
+    Periodically flush the buffer
+    """
+    await self.flush()
+    if n := self.evict():
+      self.log.debug('Evicted %d idle XP totals', n)
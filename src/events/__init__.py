@@ -1 +1,6 @@
-from .tasks import *
\ No newline at end of file
+from .tasks import *
+from .level_ups import *
+from .auto_response_data import *
+from .auto_responses import *
+from .auto_response_rules import *
+from .reactions import *
@@ -1,4 +1,4 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 __all__ = ['AutoResponseData']
 
@@ -6,9 +6,10 @@ __all__ = ['AutoResponseData']
 @dataclass
 class AutoResponseData:
   triggers: list[str]
-  emotes: list[str] = []
+  emotes: list[str] = field(default_factory=list)
   answer: str = ''
   reply: bool = False
+  fuzzy: bool = False # also match the words a typo away from a trigger
 
   def __post_init__(self):
     pass
@@ -0,0 +1,92 @@
+import os
+
+import asyncio
+import hashlib
+import json
+import logging
+from typing import Any
+
+from discord.ext import tasks
+from pyjson5 import decode_io # pylint: disable=no-name-in-module
+
+from ..db import UsefulDatabase
+from .auto_response_data import AutoResponseData
+from .auto_responses import AutoResponseMatcher
+
+__all__ = ['AutoResponseRules']
+
+AUTO_RESPONSES_PATH = os.getenv('AUTO_RESPONSES_PATH', 'data/auto_responses.json5')
+AUTO_RESPONSES_RELOAD_INTERVAL = float(os.getenv('AUTO_RESPONSES_RELOAD_INTERVAL', '60'))
+
+
+class AutoResponseRules:
+  """
+  ## Description
+  The auto-response rules, reloaded while the bot runs.\\
+  Rules are read from the local `file_path` (a JSON5 list of `AutoResponseData`) when it exists,
+  and from the `auto_responses` key of the config document otherwise. When their hash changed,
+  a new matcher is compiled off the event loop and replaces the current one in a single
+  assignment : a message always uses one complete matcher, the old or the new one.
+  """
+
+  def __init__(
+    self,
+    db: UsefulDatabase,
+    file_path: str = AUTO_RESPONSES_PATH,
+    interval: float = AUTO_RESPONSES_RELOAD_INTERVAL,
+  ):
+    self.__db = db
+    self.file_path = file_path
+    self.__matcher = AutoResponseMatcher([])
+    self.__hash: str | None = None
+    self.__file_mtime: float | None = None
+
+    self.log = logging.getLogger('resistance.auto_responses')
+    self.reload.change_interval(seconds=interval)
+
+  @property
+  def matcher(self) -> AutoResponseMatcher:
+    return self.__matcher
+
+  async def __read_rules(self) -> tuple[list[dict[str, Any]], float | None] | None:
+    """
+    Returns the raw rules with the modification time of the local file they were read from
+    (None when read from the config), or None when the file did not change since it was loaded
+    """
+    try:
+      if (mtime := os.stat(self.file_path).st_mtime) == self.__file_mtime:
+        return None
+      return await asyncio.to_thread(self.__read_file), mtime
+    except FileNotFoundError:
+      pass
+    if not self.__db.connected:
+      return [], None
+    configs = await self.__db.get_config()
+    return (configs[0].get('auto_responses', []) if configs else []), None
+
+  def __read_file(self) -> list[dict[str, Any]]:
+    with open(self.file_path, 'r', encoding='utf-8') as f:
+      return decode_io(f)
+
+  @staticmethod
+  def __build(raw_rules: list[dict[str, Any]]) -> AutoResponseMatcher:
+    return AutoResponseMatcher(AutoResponseData.from_json(rule) for rule in raw_rules)
+
+  @tasks.loop(seconds=AUTO_RESPONSES_RELOAD_INTERVAL)
+  async def reload(self) -> None:
+    """Compiles and swaps in the rules if they changed"""
+    try:
+      if (read := await self.__read_rules()) is None:
+        return
+      raw_rules, mtime = read
+      rules_hash = hashlib.sha256(json.dumps(raw_rules, sort_keys=True).encode()).hexdigest()
+      if rules_hash == self.__hash:
+        self.__file_mtime = mtime
+        return
+      matcher = await asyncio.to_thread(self.__build, raw_rules)
+    except Exception as e: # pylint: disable=broad-except
+      self.log.error('Could not reload auto-responses, keeping the current ones: %s', e)
+      return
+                           # the file is only skipped once its rules are in use : a failed load is retried
+    self.__matcher, self.__hash, self.__file_mtime = matcher, rules_hash, mtime
+    self.log.info('Loaded %d auto-responses (%d triggers)', len(matcher.rules), len(matcher))
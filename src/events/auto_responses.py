@@ -0,0 +1,133 @@
+import os
+import re
+import unicodedata
+from collections import Counter
+from collections.abc import Iterable
+from functools import lru_cache
+
+from jellyfish import damerau_levenshtein_distance, jaro_winkler_similarity # pylint: disable=no-name-in-module
+
+from .auto_response_data import AutoResponseData
+
+__all__ = ['fold', 'AutoResponseMatcher']
+
+# letters that do not decompose into a base letter and an accent
+LIGATURES = str.maketrans({'œ': 'oe', 'æ': 'ae'})
+WORD = re.compile(r'\w+')
+
+FUZZY_MIN_LEN = 7           # shorter words have too many real neighbours (salut/salue, france/franc)
+FUZZY_MIN_SIMILARITY = 0.92 # Jaro-Winkler
+FUZZY_MAX_CANDIDATES = 4    # per token, after the bigram prefilter
+
+
+def fold(text: str) -> str:
+  """Case and accent folding, so that `Écoute` and `ecoute` (or `cœur` and `COEUR`) match"""
+  decomposed = unicodedata.normalize('NFKD', text.casefold().translate(LIGATURES))
+  return ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def trie_pattern(words: Iterable[str]) -> str:
+  """
+  Builds a regex matching any of `words`, factored as a trie (`bon(?:jour|soir)`),
+  so that the regex engine follows a single path per position instead of trying every word.
+  """
+  trie: dict = {}
+  for word in words:
+    node = trie
+    for c in word:
+      node = node.setdefault(c, {})
+    node[''] = {} # end of a word
+
+  def build(node: dict) -> str:
+    if not (alternatives := [re.escape(c) + build(child) for c, child in sorted(node.items()) if c]):
+      return ''
+    body = alternatives[0] if len(alternatives) == 1 else f'(?:{"|".join(alternatives)})'
+    return f'(?:{body})?' if '' in node else body # greedy : the longest word wins
+
+  return build(trie)
+
+
+def bigrams(word: str) -> set[str]:
+  return {word[i:i + 2] for i in range(len(word) - 1)}
+
+
+def max_typos(word: str) -> int:
+  return 1 if len(word) < 12 else 2
+
+
+def only_ending_differs(word: str, trigger: str) -> bool:
+  """Whether two words only differ by their last letter, like the inflections of a French word"""
+  return len(os.path.commonprefix([word, trigger])) >= min(len(word), len(trigger)) - 1
+
+
+class AutoResponseMatcher:
+  """
+  ## Description
+  Finds the auto-responses triggered by a message.\\
+  All the (folded) triggers are compiled into a single regex, so a message is scanned once
+  whatever the number of triggers. Triggers only match whole words, and their matches do not
+  overlap : the longest trigger at a position wins, so `bonne nuit` hides an overlapping
+  `bonne` (which still matches elsewhere in the message).
+
+  For the rules with `fuzzy` set, the words of a message that trigger nothing are also compared
+  to their single word triggers of at least `FUZZY_MIN_LEN` letters, to forgive a typo (two from
+  12 letters). Words that only differ from a trigger by their ending are not typos but other
+  forms of a word (`chanter`, `chantez`) and never match. A bigram index
+  keeps only the few triggers of a close length sharing enough bigrams with the word (an edit
+  changes at most three bigrams), which are then checked with Damerau-Levenshtein and
+  Jaro-Winkler ; the verdict of each word is cached, as chats keep repeating the same words.
+  """
+
+  def __init__(self, rules: Iterable[AutoResponseData]):
+    self.rules = list(rules)
+    self.__rules_of: dict[str, list[int]] = {}       # folded trigger -> indexes of its rules
+    self.__fuzzy_rules_of: dict[str, list[int]] = {} # same, for the rules opting in fuzzy matching
+    for i, rule in enumerate(self.rules):
+      for trigger in rule.triggers:
+        if folded := fold(trigger).strip():
+          self.__rules_of.setdefault(folded, []).append(i)
+          if rule.fuzzy and len(folded) >= FUZZY_MIN_LEN and WORD.fullmatch(folded):
+            self.__fuzzy_rules_of.setdefault(folded, []).append(i)
+    pattern = rf'(?<!\w)(?:{trie_pattern(self.__rules_of)})(?!\w)'
+    self.__regex = re.compile(pattern) if self.__rules_of else None
+
+    self.__fuzzy_triggers = list(self.__fuzzy_rules_of)
+    # (length, bigram) -> indexes in __fuzzy_triggers ; a typo changes the length by one at most
+    self.__bigram_index: dict[tuple[int, str], list[int]] = {}
+    for i, trigger in enumerate(self.__fuzzy_triggers):
+      for bigram in bigrams(trigger):
+        self.__bigram_index.setdefault((len(trigger), bigram), []).append(i)
+    self.closest_trigger = lru_cache(maxsize=4096)(self.__closest_trigger)
+
+  def __len__(self) -> int:
+    return len(self.__rules_of)
+
+  def match(self, content: str) -> list[AutoResponseData]:
+    """Returns the rules triggered by a message, in rule order"""
+    if self.__regex is None:
+      return []
+    folded = fold(content)
+    hits = {i for m in self.__regex.finditer(folded) for i in self.__rules_of[m.group()]}
+    if self.__fuzzy_triggers:
+      for word in set(WORD.findall(folded)) - self.__rules_of.keys():
+        if len(word) >= FUZZY_MIN_LEN and (trigger := self.closest_trigger(word)) is not None:
+          hits.update(self.__fuzzy_rules_of[trigger])
+    return [self.rules[i] for i in sorted(hits)]
+
+  def __closest_trigger(self, word: str) -> str | None:
+    """Returns the trigger a word is a typo of, if any"""
+    typos = max_typos(word)
+    word_bigrams = bigrams(word)
+    lengths = range(len(word) - typos, len(word) + typos + 1)
+    shared = Counter(i for length in lengths for bigram in word_bigrams
+                     for i in self.__bigram_index.get((length, bigram), ()))
+    best, best_similarity = None, FUZZY_MIN_SIMILARITY
+    for i, n_shared in shared.most_common(FUZZY_MAX_CANDIDATES):
+      trigger = self.__fuzzy_triggers[i]
+      if n_shared < max(len(word_bigrams), len(trigger) - 1) - 3*typos:
+        break # sorted by shared bigrams : the next candidates are even further
+      if damerau_levenshtein_distance(word, trigger) > typos or only_ending_differs(word, trigger):
+        continue
+      if (similarity := jaro_winkler_similarity(word, trigger)) >= best_similarity:
+        best, best_similarity = trigger, similarity
+    return best
@@ -0,0 +1,118 @@
+import os
+
+import logging
+from dataclasses import dataclass
+
+import discord
+from discord.ext import commands, tasks
+
+from ..helper.constants import LVL_REWARD_ROLES, LVL_UP_CHANNEL_ID
+from ..messages import MessageSender, Embedder
+
+__all__ = ['LevelUp', 'LevelUpPipeline']
+
+LVL_UP_WINDOW = float(os.getenv('LVL_UP_WINDOW', '10'))
+LVL_UP_ROLE_INTERVAL = float(os.getenv('LVL_UP_ROLE_INTERVAL', '1'))
+MAX_LVL_UP_LINES = 20
+
+
+@dataclass(slots=True)
+class LevelUp:
+  """
+  ## Description
+  A member reaching a new level, possibly several levels at once after coalescing.
+  """
+
+  user_id: int
+  mention: str
+  old_lvl: int
+  new_lvl: int
+
+
+class LevelUpPipeline:
+  """
+  ## Description
+  Turns level ups into announcements and reward roles without flooding Discord.\\
+  Level ups are coalesced per announcement channel and sent as a single message every
+  `window` seconds. Reward roles (`LVL_REWARD_ROLES`) are queued per member, merged while
+  waiting, and granted to one member every `role_interval` seconds : this fixed pace keeps
+  role updates under the rate limit ahead of time, and should a 429 still happen, the HTTP
+  client waits for the bucket inside `add_roles`, which holds the next tick back.
+  """
+
+  def __init__(
+    self,
+    client: commands.AutoShardedBot,
+    dispatcher: MessageSender,
+    embed_builder: Embedder,
+    window: float = LVL_UP_WINDOW,
+    role_interval: float = LVL_UP_ROLE_INTERVAL,
+  ):
+    self.client = client
+    self.dispatcher = dispatcher
+    self.embed_builder = embed_builder
+    # channel_id -> user_id -> level up
+    self.__batches: dict[int, dict[int, LevelUp]] = {}
+    # (guild_id, user_id) -> role ids, members in arrival order
+    self.__pending_roles: dict[tuple[int, int], set[int]] = {}
+
+    self.log = logging.getLogger('resistance.lvl_up')
+    self.announce.change_interval(seconds=window)
+    self.grant_roles.change_interval(seconds=role_interval)
+
+  @property
+  def n_pending_roles(self) -> int:
+    return len(self.__pending_roles)
+
+  def push(self, message: discord.Message, old_lvl: int, new_lvl: int) -> None:
+    """Queues the level up of the author of a message"""
+    channel_id = self.__announce_channel_id(message)
+    batch = self.__batches.setdefault(channel_id, {})
+    if (level_up := batch.get(message.author.id)) is not None:
+      level_up.new_lvl = max(level_up.new_lvl, new_lvl)
+    else:
+      batch[message.author.id] = LevelUp(message.author.id, message.author.mention, old_lvl, new_lvl)
+
+    if roles := {role_id for lvl, role_id in LVL_REWARD_ROLES.items() if old_lvl < lvl <= new_lvl}:
+      self.__pending_roles.setdefault((message.guild.id, message.author.id), set()).update(roles)
+
+  def __announce_channel_id(self, message: discord.Message) -> int:
+    channel = message.guild.get_channel(LVL_UP_CHANNEL_ID)
+    return channel.id if channel is not None else message.channel.id
+
+  @tasks.loop(seconds=LVL_UP_WINDOW)
+  async def announce(self) -> None:
+    """Sends one message per channel for all the level ups of the window"""
+    batches, self.__batches = self.__batches, {}
+    for channel_id, batch in batches.items():
+      if (channel := self.client.get_channel(channel_id)) is None:
+        continue
+      lines = [
+        f'{level_up.mention} is now level **{level_up.new_lvl}**'
+        for level_up in sorted(batch.values(), key=lambda level_up: -level_up.new_lvl)
+      ]
+      if len(lines) > MAX_LVL_UP_LINES:
+        lines[MAX_LVL_UP_LINES:] = [f'... and {len(lines) - MAX_LVL_UP_LINES} more']
+      embed = self.embed_builder.build_response_embed(title='🎉 Level up !', description='\n'.join(lines))
+      try:
+        await self.dispatcher.send_channel_event(channel, embed)
+      except discord.HTTPException as e:
+        self.log.error('Could not announce %d level ups in channel %d: %s', len(batch), channel_id, e)
+
+  @tasks.loop(seconds=LVL_UP_ROLE_INTERVAL)
+  async def grant_roles(self) -> None:
+    """Grants the pending reward roles of the member that has waited the longest"""
+    if not self.__pending_roles:
+      return
+    (guild_id, user_id), role_ids = next(iter(self.__pending_roles.items()))
+    del self.__pending_roles[(guild_id, user_id)]
+
+    if (guild := self.client.get_guild(guild_id)) is None or (member := guild.get_member(user_id)) is None:
+      return
+    if not (roles :=
+            [role for role_id in role_ids if (role := guild.get_role(role_id)) and role not in member.roles]):
+      return
+    try:
+      await member.add_roles(*roles, reason='Level reward')
+    except discord.HTTPException as e:
+      self.log.error('Could not grant level roles to %d in guild %d: %s', user_id, guild_id, e)
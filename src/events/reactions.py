@@ -0,0 +1,79 @@
+import os
+
+import asyncio
+import logging
+
+import discord
+
+__all__ = ['ReactionDispatcher']
+
+REACTION_INTERVAL = float(os.getenv('REACTION_INTERVAL', '0.25'))
+REACTION_QUEUE_SIZE = int(os.getenv('REACTION_QUEUE_SIZE', '50'))
+
+
+class ReactionDispatcher:
+  """
+  ## Description
+  Adds reactions to messages without running into Discord rate limits.\\
+  Reactions are queued per channel (the bucket of the reaction route) and sent by one task
+  per busy channel, in arrival order, at most one every `interval` seconds : the bucket is
+  respected ahead of time instead of waiting for 429 answers. Reactions queued twice on the
+  same message are merged, and the queue of a deleted message is dropped before it is sent.
+  A channel queues the reactions of at most `max_queue` messages : past that, the reactions
+  of its oldest message are dropped, as they would come too late to matter.
+  """
+
+  def __init__(self, interval: float = REACTION_INTERVAL, max_queue: int = REACTION_QUEUE_SIZE):
+    self.interval = interval
+    self.max_queue = max(1, max_queue)
+    self.n_dropped = 0 # reactions dropped from full queues
+                       # channel_id -> message_id -> (message, emotes), in arrival order
+    self.__queues: dict[int, dict[int, tuple[discord.Message, list[str]]]] = {}
+    self.__workers: dict[int, asyncio.Task] = {}
+
+    self.log = logging.getLogger('resistance.reactions')
+
+  @property
+  def n_pending(self) -> int:
+    return sum(len(emotes) for queue in self.__queues.values() for _, emotes in queue.values())
+
+  def push(self, message: discord.Message, emotes: list[str]) -> None:
+    """Queues reactions on a message"""
+    queue = self.__queues.setdefault(message.channel.id, {})
+    if message.id not in queue and len(queue) >= self.max_queue:
+      _, dropped = queue.pop(next(iter(queue)))
+      self.n_dropped += len(dropped)
+      self.log.debug('Reaction queue of channel %d full, dropped %d reactions', message.channel.id,
+                     len(dropped))
+    _, pending = queue.setdefault(message.id, (message, []))
+    pending.extend(emote for emote in dict.fromkeys(emotes) if emote not in pending)
+    if message.channel.id not in self.__workers:
+      self.__workers[message.channel.id] = asyncio.create_task(self.__work(message.channel.id))
+
+  def cancel(self, channel_id: int, message_id: int | None = None) -> None:
+    """Drops the queued reactions of a deleted message, or of a whole channel"""
+    if message_id is None:
+      self.__queues.pop(channel_id, None)
+    elif (queue := self.__queues.get(channel_id)) is not None:
+      queue.pop(message_id, None)
+
+  async def __work(self, channel_id: int) -> None:
+    try:
+      while queue := self.__queues.get(channel_id):
+        message_id = next(iter(queue))
+        message, emotes = queue[message_id]
+        if not emotes:
+          del queue[message_id]
+          continue
+        emote = emotes.pop(0)
+        try:
+          await message.add_reaction(emote)
+        except discord.NotFound:
+          self.cancel(channel_id, message_id) # deleted before its turn came
+        except discord.HTTPException as e:
+          self.log.error('Could not react with %s to message %d: %s', emote, message_id, e)
+        await asyncio.sleep(self.interval)
+    finally:
+      del self.__workers[channel_id]
+      if not self.__queues.get(channel_id):
+        self.__queues.pop(channel_id, None)
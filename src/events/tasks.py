@@ -42,20 +42,20 @@ class TaskManager:
     self.client = client
     self.__db = db
 
-  def __reload_config(self) -> None:
+  async def __reload_config(self) -> None:
     """
     Reload the config
     """
-    self.__config = list(self.__db.get_config())[0]
+    self.__config = (await self.__db.get_config())[0]
 
   @tasks.loop(minutes=1.0)
   async def run(self) -> None:
     """
     Run the tasks
     """
-    for event in self.__db.get_events():
+    for event in await self.__db.get_events():
       if self.__valid(event):
-        self.__reload_config()
+        await self.__reload_config()
         await self.__send(event)
 
   def __valid(self, event: dict[str, Any]) -> bool:
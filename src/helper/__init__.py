@@ -2,4 +2,9 @@ from .constants import *
 
 from .auto_numbered import *
 
+from .cache import *
+
+from .levels import *
+from .members import *
+
 from .cog import UsefullCog
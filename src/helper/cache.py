@@ -0,0 +1,93 @@
+import time
+from collections import OrderedDict
+from collections.abc import Hashable
+from dataclasses import dataclass
+from typing import Generic, TypeVar
+
+__all__ = ['TtlLruCache', 'CacheStats']
+
+K = TypeVar('K', bound=Hashable)
+V = TypeVar('V')
+
+
+@dataclass
+class CacheStats:
+  """
+  ## Description
+  Counters of a `TtlLruCache`, to help sizing it.
+  """
+
+  size: int
+  maxsize: int
+  hits: int
+  misses: int
+  evictions: int
+
+  @property
+  def hit_rate(self) -> float:
+    return self.hits / total if (total := self.hits + self.misses) else 0.0
+
+  def __str__(self) -> str:
+    return f'{self.size}/{self.maxsize} entries, {self.hits} hits, {self.misses} misses '\
+           f'({self.hit_rate:.1%}), {self.evictions} evictions'
+
+
+class TtlLruCache(Generic[K, V]):
+  """
+  ## Description
+  A bounded mapping where entries expire `ttl` seconds after being written,
+  and the least recently used entry is evicted when `maxsize` is reached.\\
+  Not thread safe : it is meant to be used from the event loop only.
+
+  `generation` is bumped on every invalidation so that a reader can tell whether
+  the value it fetched may already be stale (see `put_if`).
+  """
+
+  def __init__(self, maxsize: int, ttl: float):
+    self.maxsize = maxsize
+    self.ttl = ttl
+    self.generation = 0
+    self.__data: OrderedDict[K, tuple[float, V]] = OrderedDict()
+    self.__hits = 0
+    self.__misses = 0
+    self.__evictions = 0
+
+  def __len__(self) -> int:
+    return len(self.__data)
+
+  @property
+  def stats(self) -> CacheStats:
+    return CacheStats(len(self.__data), self.maxsize, self.__hits, self.__misses, self.__evictions)
+
+  def get(self, key: K) -> V | None:
+    """Returns the cached value or None if it is missing or expired"""
+    if (entry := self.__data.get(key)) is None or entry[0] < time.monotonic():
+      if entry is not None:
+        del self.__data[key]
+      self.__misses += 1
+      return None
+    self.__data.move_to_end(key)
+    self.__hits += 1
+    return entry[1]
+
+  def put(self, key: K, value: V) -> None:
+    if self.maxsize <= 0:
+      return
+    self.__data[key] = (time.monotonic() + self.ttl, value)
+    self.__data.move_to_end(key)
+    while len(self.__data) > self.maxsize:
+      self.__data.popitem(last=False)
+      self.__evictions += 1
+
+  def put_if(self, generation: int, key: K, value: V) -> None:
+    """Caches a value only if nothing was invalidated since `generation` was read"""
+    if generation == self.generation:
+      self.put(key, value)
+
+  def invalidate(self, key: K) -> None:
+    self.generation += 1
+    self.__data.pop(key, None)
+
+  def clear(self) -> None:
+    self.generation += 1
+    self.__data.clear()
@@ -18,6 +18,8 @@ TROPHY_EMOJIS = ['🥇', '🥈', '🥉']
 
 LANDING_CHANNEL_ID = 999457471573790880
 LVL_UP_CHANNEL_ID = 999449353502593174
+# level -> role granted when reaching it
+LVL_REWARD_ROLES: dict[int, int] = {}
 
 # yapf: disable
 CLASS_IMAGES = [
@@ -0,0 +1,63 @@
+import os
+
+import asyncio
+import logging
+from collections.abc import Iterable
+
+import discord
+
+from .cache import TtlLruCache
+
+__all__ = ['MemberResolver']
+
+MEMBER_CACHE_SIZE = int(os.getenv('MEMBER_CACHE_SIZE', '10000'))
+MEMBER_CACHE_TTL = float(os.getenv('MEMBER_CACHE_TTL', '600'))
+MEMBER_DEPARTED_TTL = float(os.getenv('MEMBER_DEPARTED_TTL', '3600'))
+MEMBER_QUERY_CHUNK = 100 # most user ids a gateway member request accepts
+
+
+class MemberResolver:
+  """
+  ## Description
+  Resolves user ids to display names for the members of a guild.\\
+  Members of the client cache are read directly ; the others are fetched with one gateway member
+  request per `MEMBER_QUERY_CHUNK` ids, without adding them to the client cache. Display names
+  are cached for `ttl` seconds, and ids that are no longer members for `departed_ttl` seconds,
+  so that a leaderboard full of departed users does not query them again on every page.
+  """
+
+  def __init__(self,
+               maxsize: int = MEMBER_CACHE_SIZE,
+               ttl: float = MEMBER_CACHE_TTL,
+               departed_ttl: float = MEMBER_DEPARTED_TTL):
+    self.__names: TtlLruCache[tuple[int, int], str] = TtlLruCache(maxsize, ttl)
+    self.__departed: TtlLruCache[tuple[int, int], bool] = TtlLruCache(maxsize, departed_ttl)
+
+    self.log = logging.getLogger('resistance.members')
+
+  async def display_names(self, guild: discord.Guild, user_ids: Iterable[int]) -> dict[int, str]:
+    """Returns the display name of each user still in the guild ; departed users are left out"""
+    names: dict[int, str] = {}
+    misses: list[int] = []
+    for user_id in dict.fromkeys(user_ids):
+      if (member := guild.get_member(user_id)) is not None:
+        names[user_id] = member.display_name
+      elif (name := self.__names.get((guild.id, user_id))) is not None:
+        names[user_id] = name
+      elif self.__departed.get((guild.id, user_id)) is None:
+        misses.append(user_id)
+
+    for i in range(0, len(misses), MEMBER_QUERY_CHUNK):
+      chunk = misses[i:i + MEMBER_QUERY_CHUNK]
+      try:
+        members = await guild.query_members(user_ids=chunk, limit=len(chunk), cache=False)
+      except (asyncio.TimeoutError, discord.ClientException) as e:
+        self.log.warning('Could not fetch %d members of guild %d: %s', len(chunk), guild.id, e)
+        continue # unknown rather than departed : asked again next time
+      for member in members:
+        names[member.id] = member.display_name
+        self.__names.put((guild.id, member.id), member.display_name)
+      for user_id in chunk:
+        if user_id not in names:
+          self.__departed.put((guild.id, user_id), True)
+    return names
@@ -0,0 +1,46 @@
+import asyncio
+import os
+
+from src.db import SqliteBackend, UsefulDatabase
+from src.events import AutoResponseRules
+
+
+def test_rules_are_reloaded_when_the_file_changes(tmp_path):
+  path = tmp_path / 'auto_responses.json5'
+  path.write_text("[{triggers: ['bonjour'], answer: 'Salut !'}]", encoding='utf-8')
+  rules = AutoResponseRules(UsefulDatabase(SqliteBackend(':memory:'), workers=1), str(path))
+
+  asyncio.run(rules.reload.coro(rules))
+  first = rules.matcher
+  assert [rule.answer for rule in first.match('Bonjour')] == ['Salut !']
+
+  os.utime(path, (0, 0)) # touched but same rules : no rebuild
+  asyncio.run(rules.reload.coro(rules))
+  assert rules.matcher is first
+
+  path.write_text("[{triggers: ['bonsoir'], answer: 'Bonne soirée'}]", encoding='utf-8')
+  os.utime(path, (1, 1))
+  asyncio.run(rules.reload.coro(rules))
+  assert rules.matcher.match('Bonjour') == [] and len(rules.matcher.match('bonsoir')) == 1
+
+  path.write_text("[{triggers: ['oops'], unknown: 1}]", encoding='utf-8') # invalid rule : kept as is
+  os.utime(path, (2, 2))
+  asyncio.run(rules.reload.coro(rules))
+  assert len(rules.matcher.match('bonsoir')) == 1
+
+
+def test_failed_reloads_are_retried(tmp_path, monkeypatch):
+  path = tmp_path / 'auto_responses.json5'
+  path.write_text("[{triggers: ['bonjour']}]", encoding='utf-8')
+  rules = AutoResponseRules(UsefulDatabase(SqliteBackend(':memory:'), workers=1), str(path))
+
+  def fail(*_):
+    raise MemoryError('no memory left')
+
+  monkeypatch.setattr(AutoResponseRules, '_AutoResponseRules__build', staticmethod(fail))
+  asyncio.run(rules.reload.coro(rules))
+  assert len(rules.matcher) == 0
+
+  monkeypatch.undo() # same file, built this time
+  asyncio.run(rules.reload.coro(rules))
+  assert len(rules.matcher.match('bonjour')) == 1
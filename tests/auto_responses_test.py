@@ -0,0 +1,51 @@
+from src.events import AutoResponseData, AutoResponseMatcher, fold
+
+
+def test_fold():
+  assert fold('Écoute le CŒUR') == 'ecoute le coeur'
+
+
+def test_matcher_matches_whole_folded_words():
+  hello = AutoResponseData(triggers=['bonjour', 'salut'], answer='Salut !')
+  night = AutoResponseData(triggers=['bonne nuit'], emotes=['🌙'])
+  bon = AutoResponseData(triggers=['bon'])
+  matcher = AutoResponseMatcher([hello, night, bon])
+
+  assert matcher.match('BONJOUR à tous') == [hello]
+  assert matcher.match('Bonne nuit, salut') == [hello, night]
+  assert matcher.match('bon, bonbon') == [bon]
+  assert matcher.match('resalut') == []
+  assert AutoResponseMatcher([]).match('bonjour') == []
+
+
+def test_matcher_forgives_typos():
+  hello = AutoResponseData(triggers=['bonjour'], fuzzy=True)
+  night = AutoResponseData(triggers=['bonsoir'], fuzzy=True)
+  welcome = AutoResponseData(triggers=['bienvenue'])
+  matcher = AutoResponseMatcher([hello, night, welcome])
+
+  assert matcher.match('bnojour') == [hello]   # transposition
+  assert matcher.match('Bomsoir !') == [night] # substitution
+  assert matcher.match('bonbon') == []
+  assert matcher.match('bienvnue') == []       # fuzzy matching is opt-in
+
+
+def test_fuzzy_matcher_ignores_french_neighbours():
+  rules = [
+    AutoResponseData(triggers=[trigger], fuzzy=True)
+    for trigger in ('salut', 'france', 'guilde', 'merci', 'chanter', 'bienvenue')
+  ]
+  matcher = AutoResponseMatcher(rules)
+
+  for message in ('il me salue', 'un franc', 'la guide du jeu', 'mercy', 'vous chantez', 'il est bienvenu'):
+    assert matcher.match(message) == [], message
+  assert matcher.match('bienvneue') == [rules[-1]]
+
+
+def test_longest_overlapping_trigger_wins():
+  night = AutoResponseData(triggers=['bonne nuit'])
+  good = AutoResponseData(triggers=['bonne'])
+  matcher = AutoResponseMatcher([good, night])
+
+  assert matcher.match('bonne nuit') == [night] # `bonne` is part of the longer match
+  assert matcher.match('bonne nuit et bonne chance') == [good, night]
@@ -0,0 +1,127 @@
+import asyncio
+import datetime
+from types import SimpleNamespace
+
+import discord
+
+from src.core.backfill import HistoryBackfill
+from src.core.checkpoints import ChannelToLastMessageInfo
+from src.db import Period, SqliteBackend, UsefulDatabase, XpBuffer
+
+GUILD = SimpleNamespace(id=1)
+NOW = datetime.datetime.now(datetime.timezone.utc)
+
+
+def message(message_id: int, user_id: int, channel):
+  author = SimpleNamespace(id=user_id, name=f'user{user_id}', bot=False)
+  return SimpleNamespace(id=message_id, author=author, channel=channel, created_at=NOW)
+
+
+class FakeChannel:
+
+  def __init__(self, channel_id: int, n_messages: int):
+    self.id = channel_id
+    self.guild = GUILD
+    self.messages = [message(channel_id*1000 + i, i % 3, self) for i in range(1, n_messages + 1)]
+
+  async def history(self, limit=None, after=None, before=None, oldest_first=True): # pylint: disable=unused-argument
+    for m in self.messages:
+      if after is None or m.id > after.id:
+        yield m
+
+
+def test_backfill_resumes_from_checkpoints(tmp_path, monkeypatch):
+  monkeypatch.setattr(ChannelToLastMessageInfo, 'file_path', str(tmp_path / 'last_message.log'))
+  db = UsefulDatabase(SqliteBackend(':memory:'), workers=1)
+  db.connect()
+  buffer = XpBuffer(db)
+  channels = [FakeChannel(1, 10), FakeChannel(2, 5)]
+
+  backfill = HistoryBackfill(ChannelToLastMessageInfo(),
+                             buffer,
+                             lambda _: 1,
+                             concurrency=1,
+                             batch_size=4,
+                             max_age=0)
+  assert asyncio.run(backfill.run(channels)) == 15
+  assert db.backend.get_user_xp(1, 0) + db.backend.get_user_xp(1, 1) + db.backend.get_user_xp(1, 2) == 15
+
+  # a fresh process only crawls what was posted since
+  channels[0].messages.append(message(1011, 0, channels[0]))
+  backfill = HistoryBackfill(ChannelToLastMessageInfo(),
+                             buffer,
+                             lambda _: 1,
+                             concurrency=1,
+                             batch_size=4,
+                             max_age=0)
+  assert asyncio.run(backfill.run(channels)) == 1
+  assert ChannelToLastMessageInfo().last_message_id(1) == 1011
+
+
+def test_backfilled_xp_lands_in_the_buckets_of_its_days(tmp_path, monkeypatch):
+  monkeypatch.setattr(ChannelToLastMessageInfo, 'file_path', str(tmp_path / 'last_message.log'))
+  db = UsefulDatabase(SqliteBackend(':memory:'), workers=1)
+  db.connect()
+  channel = FakeChannel(1, 3)
+  for m, days_ago in zip(channel.messages, (40, 10, 2)):
+    m.created_at = NOW - datetime.timedelta(days=days_ago)
+
+  backfill = HistoryBackfill(ChannelToLastMessageInfo(), XpBuffer(db), lambda _: 1, batch_size=10, max_age=0)
+  assert asyncio.run(backfill.run([channel])) == 3
+  assert [(e.id, e.xp) for e in asyncio.run(db.period_users(GUILD.id, Period.WEEK))] == [(0, 1)]
+  assert sorted(e.id for e in asyncio.run(db.period_users(GUILD.id, Period.MONTH))) == [0, 2]
+  assert db.backend.get_user_xp(GUILD.id, 1) == 1 # the 40 days old message only counts in the lifetime XP
+
+
+def test_backfill_bounds_channels_without_checkpoint(tmp_path, monkeypatch):
+  monkeypatch.setattr(ChannelToLastMessageInfo, 'file_path', str(tmp_path / 'last_message.log'))
+  db = UsefulDatabase(SqliteBackend(':memory:'), workers=1)
+  db.connect()
+  channel = FakeChannel(1, 3)
+  for m, days_ago in zip(channel.messages, (400, 20, 2)):
+    m.created_at = NOW - datetime.timedelta(days=days_ago)
+    m.id = discord.utils.time_snowflake(m.created_at)
+
+  backfill = HistoryBackfill(ChannelToLastMessageInfo(), XpBuffer(db), lambda _: 1, max_age=30)
+  assert asyncio.run(backfill.run([channel])) == 2
+  assert db.backend.get_user_xp(GUILD.id, 1) == -1 # the 400 days old message is never crawled
+
+
+def test_live_messages_tracked_before_run_are_held(tmp_path, monkeypatch):
+  monkeypatch.setattr(ChannelToLastMessageInfo, 'file_path', str(tmp_path / 'last_message.log'))
+  db = UsefulDatabase(SqliteBackend(':memory:'), workers=1)
+  db.connect()
+  channel = FakeChannel(1, 10)
+  checkpoints = ChannelToLastMessageInfo()
+  checkpoints.update(1, 1002, 0)
+
+  backfill = HistoryBackfill(checkpoints, XpBuffer(db), lambda _: 1, batch_size=4, max_age=0)
+  backfill.hold()
+  backfill.track(message(1011, 0, channel)) # processed live before the crawl started
+  assert checkpoints.last_message_id(1) == 1002
+  assert asyncio.run(backfill.run([channel])) == 8
+  assert checkpoints.last_message_id(1) == 1011
+
+  backfill.track(message(1012, 0, channel)) # the crawl is over
+  assert checkpoints.last_message_id(1) == 1012
+
+
+def test_failed_crawls_keep_the_held_checkpoint(tmp_path, monkeypatch):
+  monkeypatch.setattr(ChannelToLastMessageInfo, 'file_path', str(tmp_path / 'last_message.log'))
+  db = UsefulDatabase(SqliteBackend(':memory:'), workers=1)
+  db.connect()
+  channel = FakeChannel(1, 10)
+  history = channel.history
+
+  async def broken_history(**kwargs):
+    async for m in history(**kwargs):
+      if m.id == 1006:
+        raise ConnectionError('connection lost')
+      yield m
+
+  channel.history = broken_history
+  backfill = HistoryBackfill(ChannelToLastMessageInfo(), XpBuffer(db), lambda _: 1, batch_size=4, max_age=0)
+  backfill.hold()
+  backfill.track(message(1011, 0, channel))
+  assert asyncio.run(backfill.run([channel])) == 0
+  assert ChannelToLastMessageInfo().last_message_id(1) == 1011 # not scored again on the next start
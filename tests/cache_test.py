@@ -0,0 +1,31 @@
+import time
+
+from src.helper import TtlLruCache
+
+
+def test_lru_eviction():
+  cache: TtlLruCache[int, int] = TtlLruCache(maxsize=2, ttl=60)
+  cache.put(1, 10)
+  cache.put(2, 20)
+  assert cache.get(1) == 10 # 1 is now the most recently used
+  cache.put(3, 30)
+  assert cache.get(2) is None
+  assert cache.get(1) == 10 and cache.get(3) == 30
+  stats = cache.stats
+  assert (stats.hits, stats.misses, stats.evictions) == (3, 1, 1)
+
+
+def test_ttl_expiry():
+  cache: TtlLruCache[int, int] = TtlLruCache(maxsize=2, ttl=0.01)
+  cache.put(1, 10)
+  time.sleep(0.02)
+  assert cache.get(1) is None
+  assert len(cache) == 0
+
+
+def test_put_if_skips_stale_reads():
+  cache: TtlLruCache[int, int] = TtlLruCache(maxsize=2, ttl=60)
+  generation = cache.generation
+  cache.invalidate(1) # a write happened while the read was in flight
+  cache.put_if(generation, 1, 10)
+  assert cache.get(1) is None
@@ -0,0 +1,100 @@
+import asyncio
+
+from src.core.checkpoints import ChannelToLastMessageInfo
+
+
+def test_checkpoints_survive_reload(tmp_path, monkeypatch):
+  monkeypatch.setattr(ChannelToLastMessageInfo, 'file_path', str(tmp_path / 'last_message.log'))
+  checkpoints = ChannelToLastMessageInfo(flush_interval=3600, flush_size=1000)
+  checkpoints.update(1, 10, 1.5)
+  checkpoints.update(2, 20, 2.5)
+  checkpoints.update(1, 5, 0.5)                                # never moves backward
+  assert ChannelToLastMessageInfo().last_message_id(1) is None # not flushed yet
+  checkpoints.save()
+  checkpoints.update(1, 11, 3.5)
+  checkpoints.save()
+
+  with open(tmp_path / 'last_message.log', 'a', encoding='utf-8') as f:
+    f.write('3 30') # torn write
+  reloaded = ChannelToLastMessageInfo()
+  assert reloaded.data == {1: (11, 3.5), 2: (20, 2.5)}
+  reloaded.update(4, 40, 4.5)
+  reloaded.save()
+  assert ChannelToLastMessageInfo().data == {1: (11, 3.5), 2: (20, 2.5), 4: (40, 4.5)}
+
+
+def test_checkpoints_compaction(tmp_path, monkeypatch):
+  monkeypatch.setattr(ChannelToLastMessageInfo, 'file_path', str(tmp_path / 'last_message.log'))
+  checkpoints = ChannelToLastMessageInfo(flush_interval=3600, flush_size=1)
+  for message_id in range(100):
+    checkpoints.update(1, message_id, 0.0)
+  with open(tmp_path / 'last_message.log', encoding='utf-8') as f:
+    assert len(f.readlines()) <= 2
+  assert ChannelToLastMessageInfo().last_message_id(1) == 99
+
+
+def test_checkpoints_migrate_legacy_file(tmp_path, monkeypatch):
+  monkeypatch.setattr(ChannelToLastMessageInfo, 'file_path', str(tmp_path / 'last_message.log'))
+  monkeypatch.setattr(ChannelToLastMessageInfo, 'legacy_file_path', str(tmp_path / 'last_message.json5'))
+  (tmp_path / 'last_message.json5').write_text("{'42': {id: 7, timestamp: 1.0}}", encoding='utf-8')
+  assert ChannelToLastMessageInfo().last_message_id(42) == 7
+  assert (tmp_path / 'last_message.log').exists()
+
+
+def test_checkpoints_skip_malformed_lines(tmp_path, monkeypatch):
+  monkeypatch.setattr(ChannelToLastMessageInfo, 'file_path', str(tmp_path / 'last_message.log'))
+  (tmp_path / 'last_message.log').write_text('1 10 1.5\n3 3x 1.0\n2 20\n4 40 4.5\n', encoding='utf-8')
+  assert ChannelToLastMessageInfo().data == {1: (10, 1.5), 4: (40, 4.5)}
+  assert (tmp_path / 'last_message.log').read_text(encoding='utf-8') == '1 10 1.5\n4 40 4.5\n'
+
+
+def test_checkpoints_are_written_off_the_event_loop(tmp_path, monkeypatch):
+  monkeypatch.setattr(ChannelToLastMessageInfo, 'file_path', str(tmp_path / 'last_message.log'))
+  threads = []
+  to_thread = asyncio.to_thread
+
+  async def spy(func, *args):
+    threads.append(func)
+    return await to_thread(func, *args)
+
+  monkeypatch.setattr(asyncio, 'to_thread', spy)
+  checkpoints = ChannelToLastMessageInfo(flush_interval=3600, flush_size=2)
+
+  async def scenario() -> None:
+    checkpoints.update(1, 10, 1.5)
+    checkpoints.update(2, 20, 2.5) # schedules a background flush
+    await asyncio.sleep(0.05)
+    checkpoints.update(1, 11, 3.5)
+    await checkpoints.flush()
+
+  asyncio.run(scenario())
+  assert len(threads) == 2
+  assert ChannelToLastMessageInfo().data == {1: (11, 3.5), 2: (20, 2.5)}
+
+
+def test_blocking_save_supersedes_a_background_batch(tmp_path, monkeypatch):
+  monkeypatch.setattr(ChannelToLastMessageInfo, 'file_path', str(tmp_path / 'last_message.log'))
+  to_thread = asyncio.to_thread
+  checkpoints = ChannelToLastMessageInfo(flush_interval=3600, flush_size=1000)
+
+  async def scenario() -> None:
+    started = asyncio.Event()
+    go = asyncio.Event()
+
+    async def delayed(func, *args):
+      started.set()
+      await go.wait()
+      return await to_thread(func, *args)
+
+    monkeypatch.setattr(asyncio, 'to_thread', delayed)
+    checkpoints.update(1, 10, 1.5)
+    flush = asyncio.create_task(checkpoints.flush())
+    await started.wait() # the batch is taken, not written yet
+    checkpoints.update(1, 11, 2.5)
+    checkpoints.save()   # a shutdown in between
+    go.set()
+    await flush
+
+  asyncio.run(scenario())
+  with open(ChannelToLastMessageInfo.file_path, encoding='utf-8') as f:
+    assert f.read() == '1 11 2.5\n' # the superseded batch was never appended after it
@@ -0,0 +1,38 @@
+import asyncio
+from types import SimpleNamespace
+
+from src.core.ingestion import Backpressure, IngestionQueue
+
+
+def run_queue(policy: Backpressure) -> tuple[list[int], IngestionQueue]:
+  handled: list[int] = []
+
+  async def handler(message):
+    handled.append(message.id)
+
+  async def scenario() -> IngestionQueue:
+    queue = IngestionQueue(handler, maxsize=3, workers=2, policy=policy)
+    for i in range(5): # workers not started yet : the queue fills up
+      await queue.put(SimpleNamespace(id=i))
+    queue.start()
+    await queue.join()
+    queue.stop()
+    return queue
+
+  return handled, asyncio.run(scenario())
+
+
+def test_drop_policy_keeps_oldest_messages():
+  handled, queue = run_queue(Backpressure.DROP)
+  assert sorted(handled) == [0, 1, 2]
+  assert queue.stats.dropped == 2 and queue.stats.processed == 3
+
+
+def test_shed_policy_keeps_newest_messages():
+  handled, queue = run_queue(Backpressure.SHED)
+  assert sorted(handled) == [2, 3, 4]
+  assert queue.stats.dropped == 2 and queue.stats.depth == 0
+
+
+def test_backpressure_from_str():
+  assert Backpressure.from_str('Block') is Backpressure.BLOCK
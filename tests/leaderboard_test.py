@@ -0,0 +1,126 @@
+import asyncio
+from types import SimpleNamespace
+
+from src.commands.xp import LeaderBoardView
+from src.db import LeaderboardSnapshot, LeaderboardSnapshots, Period, SqliteBackend, UsefulDatabase
+from src.helper import MemberResolver
+
+GUILD = 7
+
+
+def member(user_id: int):
+  return SimpleNamespace(id=user_id, display_name=f'user{user_id}')
+
+
+def test_leaderboard_pages_are_rendered_on_demand():
+  db = UsefulDatabase(SqliteBackend(':memory:'), workers=1)
+  db.connect()
+  db.backend.bulk_add_xp({(GUILD, user_id): ('', user_id * 10) for user_id in range(1, 26)})
+  queried = []
+
+  async def query_members(user_ids: list[int], **_):
+    queried.append(user_ids)
+    return [member(user_id) for user_id in user_ids if user_id != 24]
+
+  guild = SimpleNamespace(id=GUILD,
+                          get_member=lambda user_id: member(user_id) if user_id % 2 else None,
+                          query_members=query_members)
+  interaction = SimpleNamespace(guild=guild)
+
+  async def scenario() -> tuple[LeaderBoardView, list[str], list[str]]:
+    snapshots = LeaderboardSnapshots(db, staleness=1, min_age=0)
+    members = MemberResolver()
+    # ranks loaded on demand, by a single build for concurrent views
+    views = await asyncio.gather(
+      *(LeaderBoardView(interaction, None, None, snapshots, members).setup() for _ in range(3)))
+    assert len({id(snapshot) for snapshot in await asyncio.gather(*(snapshots.get(GUILD) for _ in range(3)))
+               }) == 1
+
+    db.ranks(GUILD).update(1, 1000)
+    assert (await snapshots.get(GUILD)).ids[0] == 25 # within the staleness threshold
+    db.ranks(GUILD).update(2, 2000)
+    assert (await snapshots.get(GUILD)).ids[:2] == (2, 1)
+    return views[0], (await views[0].page(0)).splitlines(), (await views[0].page(2)).splitlines()
+
+  view, first, last = asyncio.run(scenario())
+  assert view.n_pages == 3
+  assert first[0] == '1. `user25` (<@25>) 250 XP (2)'
+  assert first[1] == '2. <@24> 240 XP (1)'            # no longer a member
+  assert first[3] == '4. `user22` (<@22>) 220 XP (1)' # fetched, not in the member cache
+  assert queried == [[24, 22, 20, 18, 16], [4, 2]]    # one request per page for the misses
+  assert len(last) == 5 and last[-1] == '25. `user1` (<@1>) 10 XP (0)'
+  assert view.wrap_page_no(3) == 0
+
+
+def test_period_leaderboard_sums_recent_buckets():
+  db = UsefulDatabase(SqliteBackend(':memory:'), workers=1)
+  db.connect()
+  today = Period.WEEK.first_day + 6
+  db.backend.bulk_add_xp({(GUILD, 1): ('', 100), (GUILD, 2): ('', 10)}, day=today - 10)
+  db.backend.bulk_add_xp({(GUILD, 2): ('', 20)}, day=today)
+  db.backend.bulk_add_xp({(GUILD, 3): ('', 5)}, day=today - 6)
+
+  guild = SimpleNamespace(id=GUILD, get_member=member)
+
+  async def scenario() -> tuple[LeaderboardSnapshot, LeaderboardSnapshot, LeaderboardSnapshot, str]:
+    snapshots = LeaderboardSnapshots(db)
+    week = await snapshots.get(GUILD, Period.WEEK)
+    view = await LeaderBoardView(SimpleNamespace(guild=guild),
+                                 None,
+                                 None,
+                                 snapshots,
+                                 MemberResolver(),
+                                 period=Period.WEEK).setup()
+    return week, await snapshots.get(GUILD, Period.MONTH), await snapshots.get(GUILD), await view.page(0)
+
+  week, month, lifetime, page = asyncio.run(scenario())
+  assert (week.ids, week.xps) == ((2, 3), (20, 5))
+  assert page.splitlines()[0] == '1. `user2` (<@2>) 20 XP' # no level for the XP of a period
+  assert (month.ids, month.xps) == ((1, 2, 3), (100, 30, 5))
+  assert lifetime.ids == (1, 2, 3) and lifetime.period is Period.ALL
+
+
+def test_roll_over_compacts_once_a_day():
+  db = UsefulDatabase(SqliteBackend(':memory:'), workers=1)
+  db.connect()
+  today = Period.WEEK.first_day + 6
+  stale = 'INSERT INTO guild_user_days VALUES (?, ?, ?, 10)' # aged past the retention since it was written
+  db.backend._SqliteBackend__execute(stale, (GUILD, today - 40, 1))
+  db.backend.bulk_add_xp({(GUILD, 2): ('', 10)}, day=today)
+
+  asyncio.run(db.roll_over.coro(db))
+  assert [e.id for e in db.backend.period_users(GUILD, 0)] == [2]
+  db.backend._SqliteBackend__execute(stale, (GUILD, today - 40, 1))
+  asyncio.run(db.roll_over.coro(db)) # already done today
+  assert sorted(e.id for e in db.backend.period_users(GUILD, 0)) == [1, 2]
+
+
+def test_snapshots_are_kept_for_their_min_age():
+  db = UsefulDatabase(SqliteBackend(':memory:'), workers=1)
+  db.connect()
+  db.backend.bulk_add_xp({(GUILD, 1): ('', 10)})
+
+  async def scenario() -> None:
+    snapshots = LeaderboardSnapshots(db, staleness=0, min_age=3600)
+    first = await snapshots.get(GUILD)
+    db.ranks(GUILD).update(2, 20)
+    assert await snapshots.get(GUILD) is first # too recent to be rebuilt
+    snapshots.min_age = 0
+    assert (await snapshots.get(GUILD)).ids == (2, 1)
+
+  asyncio.run(scenario())
+
+
+def test_changed_snapshots_are_rebuilt_past_their_max_age():
+  db = UsefulDatabase(SqliteBackend(':memory:'), workers=1)
+  db.connect()
+  db.backend.bulk_add_xp({(GUILD, 1): ('', 10)})
+
+  async def scenario() -> None:
+    snapshots = LeaderboardSnapshots(db, staleness=1000, min_age=0, max_age=0)
+    first = await snapshots.get(GUILD)
+    assert await snapshots.get(GUILD) is first # unchanged : kept whatever its age
+    db.ranks(GUILD).update(2, 20)              # a single change, far within the staleness
+    assert (await snapshots.get(GUILD)).ids == (2, 1)
+
+  asyncio.run(scenario())
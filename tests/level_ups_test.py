@@ -0,0 +1,42 @@
+import asyncio
+from types import SimpleNamespace
+
+from src.events import level_ups
+from src.events.level_ups import LevelUpPipeline
+from src.messages import Embedder
+
+
+class FakeChannel:
+
+  def __init__(self, channel_id: int):
+    self.id = channel_id
+    self.sent: list[str] = []
+
+
+class FakeSender:
+
+  async def send_channel_event(self, channel: FakeChannel, embed, content: str = None):
+    channel.sent.append(embed.description)
+
+
+def message(user_id: int, channel: FakeChannel):
+  guild = SimpleNamespace(id=1, get_channel=lambda channel_id: None) # no level up channel in this guild
+  author = SimpleNamespace(id=user_id, mention=f'<@{user_id}>')
+  return SimpleNamespace(guild=guild, author=author, channel=channel)
+
+
+def test_level_ups_are_coalesced_per_channel(monkeypatch):
+  monkeypatch.setattr(level_ups, 'LVL_REWARD_ROLES', {2: 20, 3: 30})
+  channel = FakeChannel(7)
+  client = SimpleNamespace(get_channel=lambda channel_id: channel if channel_id == 7 else None)
+  pipeline = LevelUpPipeline(client, FakeSender(), Embedder())
+
+  pipeline.push(message(1, channel), 1, 2)
+  pipeline.push(message(1, channel), 2, 3)
+  pipeline.push(message(2, channel), 4, 5)
+  assert pipeline.n_pending_roles == 1 # both rewards of user 1 are merged
+
+  asyncio.run(pipeline.announce.coro(pipeline))
+  assert channel.sent == ['<@2> is now level **5**\n<@1> is now level **3**']
+  asyncio.run(pipeline.announce.coro(pipeline))
+  assert len(channel.sent) == 1 # nothing new to announce
@@ -0,0 +1,14 @@
+from src.helper.levels import MAX_LVL, lvl_to_xp, xp_to_lvl, xp_to_lvls
+
+
+def test_xp_to_lvl_bounds():
+  assert xp_to_lvl(-5) == 0
+  assert xp_to_lvl(lvl_to_xp(1) - 1) == 0
+  assert xp_to_lvl(lvl_to_xp(1)) == 1
+  assert xp_to_lvl(lvl_to_xp(42) - 1) == 41
+  assert xp_to_lvl(lvl_to_xp(MAX_LVL) + 10**6) == MAX_LVL
+
+
+def test_xp_to_lvls_matches_single_lookups():
+  xps = list(range(-10, lvl_to_xp(MAX_LVL) + 100, 97))
+  assert xp_to_lvls(xps) == [xp_to_lvl(xp) for xp in xps]
@@ -0,0 +1,33 @@
+import asyncio
+from types import SimpleNamespace
+
+from src.helper import MemberResolver
+from src.helper import members as members_module
+
+GUILD = 7
+
+
+def test_misses_are_batched_and_departed_members_remembered(monkeypatch):
+  monkeypatch.setattr(members_module, 'MEMBER_QUERY_CHUNK', 2)
+  queried = []
+
+  async def query_members(user_ids: list[int], **_):
+    queried.append(user_ids)
+    return [
+      SimpleNamespace(id=user_id, display_name=f'user{user_id}') for user_id in user_ids if user_id != 3
+    ]
+
+  guild = SimpleNamespace(id=GUILD,
+                          get_member=lambda user_id: SimpleNamespace(display_name='cached')
+                          if user_id == 1 else None,
+                          query_members=query_members)
+  resolver = MemberResolver()
+
+  async def scenario() -> tuple[dict[int, str], dict[int, str]]:
+    return await resolver.display_names(guild,
+                                        [1, 2, 3, 4, 2]), await resolver.display_names(guild, [2, 3, 4])
+
+  first, second = asyncio.run(scenario())
+  assert first == {1: 'cached', 2: 'user2', 4: 'user4'}
+  assert second == {2: 'user2', 4: 'user4'}
+  assert queried == [[2, 3], [4]] # the second call is served by the name and departed caches
@@ -0,0 +1,26 @@
+import asyncio
+
+from src.db import SqliteBackend, UsefulDatabase
+
+
+def test_migrate_legacy_users():
+  backend = SqliteBackend(':memory:')
+  backend.connect()
+  backend._SqliteBackend__execute(
+    'CREATE TABLE users (id_user INTEGER PRIMARY KEY, name_user TEXT, xp INTEGER)')
+  backend._SqliteBackend__execute(
+    "INSERT INTO users VALUES (1, 'alice', 100), (2, 'bob', 50), (3, 'carol', 10)")
+  db = UsefulDatabase(backend, workers=1)
+
+  async def migrate() -> int:
+    await db.add_xp_to_user(10, 1, 'alice', 5) # earned after the switch to per guild XP
+    assert sorted(await db.legacy_user_ids()) == [1, 2, 3]
+    return await db.migrate_legacy_users({1: [10, 20, 30], 2: [10]})
+
+  assert asyncio.run(migrate()) == 2
+  assert asyncio.run(db.get_user_xp(10, 1)) == 39 # 34 + 5
+  assert asyncio.run(db.get_user_xp(20, 1)) == 33
+  assert asyncio.run(db.get_user_xp(30, 1)) == 33
+  assert asyncio.run(db.get_user_xp(10, 2)) == 50
+  assert asyncio.run(db.legacy_user_ids()) == [3]
+  assert db.ranks(10).rank_of(2) == 1 and db.ranks(10).rank_of(1) == 2
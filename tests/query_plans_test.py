@@ -0,0 +1,23 @@
+import asyncio
+
+from src.db import SqliteBackend, UsefulDatabase
+from src.db.sqlite_backend import INDEXES
+
+
+def test_indexes_are_created_once():
+  backend = SqliteBackend(':memory:')
+  backend.connect()
+  assert backend.ensure_indexes() == list(INDEXES)
+  assert backend.ensure_indexes() == []
+
+
+def test_query_plans_report_the_scans_until_indexed():
+  db = UsefulDatabase(SqliteBackend(':memory:'), workers=1)
+  db.connect()
+
+  async def scenario() -> tuple[list[str], list[str]]:
+    before = await db.check_query_plans()
+    await db.ensure_indexes()
+    return before, await db.check_query_plans()
+
+  assert asyncio.run(scenario()) == (['enabled events'], [])
@@ -0,0 +1,59 @@
+import asyncio
+
+from src.db import ExportUserEntry, RankIndex, SqliteBackend, UsefulDatabase
+
+
+def test_rank_index():
+  ranks = RankIndex()
+  ranks.load([ExportUserEntry(id=1, xp=10), ExportUserEntry(id=2, xp=30), ExportUserEntry(id=3, xp=20)])
+  assert [e.id for e in ranks.page(0, 3)] == [2, 3, 1]
+  assert ranks.rank_of(3) == 2 and ranks.rank_of(42) == 0
+
+  ranks.update(1, 40)
+  ranks.update(4, 5)
+  assert [e.id for e in ranks.page(0, 10)] == [1, 2, 3, 4]
+  assert [e.id for e in ranks.page(1, 2)] == [2, 3]
+  assert ranks.at(1) == ExportUserEntry(id=1, xp=40)
+  assert ranks.at(5) is None
+
+
+def test_rank_index_load_keeps_newer_totals():
+  ranks = RankIndex()
+  ranks.update(1, 50) # incremented while the users were being loaded
+  ranks.load([ExportUserEntry(id=1, xp=10), ExportUserEntry(id=2, xp=20)])
+  assert ranks.xp_of(1) == 50
+  assert len(ranks) == 2
+
+
+def test_rank_index_load_columns():
+  backend = SqliteBackend(':memory:')
+  backend.connect()
+  backend.bulk_add_xp({(1, user_id): ('', user_id * 10) for user_id in range(1, 6)})
+  columns = backend.user_columns(1, batch_size=2)
+  assert sorted(columns) == [(user_id, user_id * 10) for user_id in range(1, 6)]
+
+  ranks = RankIndex()
+  ranks.load_columns(columns)
+  assert [e.id for e in ranks.page(0, 2)] == [5, 4]
+
+
+def test_user_rank_gap():
+  ranks = RankIndex()
+  ranks.load([ExportUserEntry(id=1, xp=10), ExportUserEntry(id=2, xp=30), ExportUserEntry(id=3, xp=25)])
+  assert ranks.user_rank(1).rank == 3 and ranks.user_rank(1).gap == 15
+  assert ranks.user_rank(1).above.id == 3
+  assert ranks.user_rank(2).above is None and ranks.user_rank(2).gap == 0
+  assert ranks.user_rank(4) is None
+
+
+def test_user_scans_release_the_connection_between_batches():
+  backend = SqliteBackend(':memory:')
+  backend.connect()
+  backend.bulk_add_xp({(1, user_id): ('', user_id * 10) for user_id in range(1, 6)})
+  batches = backend._SqliteBackend__stream('SELECT id_user FROM guild_users WHERE id_guild = ?', (1,), 2)
+  assert len(next(batches)) == 2
+  assert backend.get_user_xp(1, 1) == 10 # would wait on the lock forever if the scan held it
+  assert sum(len(batch) for batch in batches) == 3
+
+  db = UsefulDatabase(backend, workers=1, batch_size=2)
+  assert len(asyncio.run(db.user_columns(1))) == 5
@@ -0,0 +1,59 @@
+import asyncio
+from types import SimpleNamespace
+
+import discord
+
+from src.events import ReactionDispatcher
+
+
+class FakeMessage:
+
+  def __init__(self, message_id: int, channel_id: int, sent: list, deleted: bool = False):
+    self.id = message_id
+    self.channel = SimpleNamespace(id=channel_id)
+    self.sent = sent
+    self.deleted = deleted
+
+  async def add_reaction(self, emote: str):
+    if self.deleted:
+      raise discord.NotFound(SimpleNamespace(status=404, reason='Not Found'), 'Unknown Message')
+    self.sent.append((self.id, emote))
+
+
+def test_reactions_are_ordered_merged_and_cancelled():
+  sent: list[tuple[int, str]] = []
+
+  async def scenario():
+    dispatcher = ReactionDispatcher(interval=0)
+    first, second, third = FakeMessage(1, 10, sent), FakeMessage(2, 10, sent), FakeMessage(3, 10, sent)
+    gone = FakeMessage(4, 10, sent, deleted=True)
+    dispatcher.push(first, ['👋', '👋', '🌙'])
+    dispatcher.push(second, ['🔥'])
+    dispatcher.push(gone, ['❌', '❌❌'])
+    dispatcher.push(first, ['🌙', '⭐']) # merged into the pending reactions of the first message
+    dispatcher.push(third, ['🗑️'])
+    dispatcher.cancel(10, 3)           # deleted before its turn
+    while dispatcher.n_pending:
+      await asyncio.sleep(0)
+    await asyncio.sleep(0)
+
+  asyncio.run(scenario())
+  assert sent == [(1, '👋'), (1, '🌙'), (1, '⭐'), (2, '🔥')]
+
+
+def test_full_queues_drop_their_oldest_message():
+  sent: list[tuple[int, str]] = []
+
+  async def scenario() -> ReactionDispatcher:
+    dispatcher = ReactionDispatcher(interval=0, max_queue=2)
+    for message_id in range(1, 5):
+      dispatcher.push(FakeMessage(message_id, 10, sent), ['👋', '🌙'])
+    dispatcher.push(FakeMessage(4, 10, sent), ['⭐']) # merged, nothing dropped
+    while dispatcher.n_pending:
+      await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    return dispatcher
+
+  dispatcher = asyncio.run(scenario())
+  assert dispatcher.n_dropped == 4
+  assert sent == [(3, '👋'), (3, '🌙'), (4, '👋'), (4, '🌙'), (4, '⭐')]
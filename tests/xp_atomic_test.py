@@ -0,0 +1,102 @@
+import asyncio
+import os
+import sqlite3
+from types import SimpleNamespace
+
+import pytest
+from pymongo.errors import PyMongoError
+
+from src.db import MongoBackend, SqliteBackend, StorageBackend, UsefulDatabase, xp_day
+
+TEST_DB_URI = os.getenv('TEST_DB_URI', 'mongodb://localhost:27017')
+GUILD = 42
+
+
+class TestMongoBackend(MongoBackend):
+  __test__ = False
+
+  @property
+  def users_collection(self):
+    return self.client.resistance_tests.Utilisateurs
+
+
+@pytest.fixture(name='backend', params=['sqlite', 'mongo'])
+def fixture_backend(request):
+  if request.param == 'sqlite':
+    backend = SqliteBackend(':memory:')
+    backend.connect()
+    yield backend
+    backend.disconnect()
+    return
+
+  backend = TestMongoBackend(TEST_DB_URI, serverSelectionTimeoutMS=500)
+  backend.connect()
+  try:
+    backend.test()
+  except PyMongoError:
+    backend.disconnect()
+    pytest.skip(f'no MongoDB server reachable at {TEST_DB_URI}')
+  backend.users_collection.drop()
+  yield backend
+  backend.users_collection.drop()
+  backend.disconnect()
+
+
+def test_add_xp_creates_user(backend: StorageBackend):
+  db = UsefulDatabase(backend, workers=1)
+  assert asyncio.run(db.add_xp_to_user(GUILD, 1, 'alice', 10)) == 0
+  assert asyncio.run(db.add_xp_to_user(GUILD, 1, 'alice', 5)) == 10
+  assert asyncio.run(db.get_user_xp(GUILD, 1)) == 15
+  assert len(asyncio.run(db.users(GUILD))) == 1
+
+
+def test_add_xp_concurrent(backend: StorageBackend):
+  db = UsefulDatabase(backend, workers=8)
+  asyncio.run(db.add_xp_to_user(GUILD, 1, 'alice', 0))
+  n = 200
+
+  async def burst() -> list[int]:
+    return await asyncio.gather(*(db.add_xp_to_user(GUILD, 1, 'alice', 1) for _ in range(n)))
+
+  # every increment sees a distinct pre-image : none of them was lost or applied twice
+  assert sorted(asyncio.run(burst())) == list(range(n))
+  assert asyncio.run(db.get_user_xp(GUILD, 1)) == n
+
+
+def test_add_xp_per_guild(backend: StorageBackend):
+  db = UsefulDatabase(backend, workers=1)
+  asyncio.run(db.add_xp_to_user(GUILD, 1, 'alice', 10))
+  asyncio.run(db.add_xp_to_user(GUILD + 1, 1, 'alice', 3))
+  assert asyncio.run(db.get_user_xp(GUILD, 1)) == 10
+  assert asyncio.run(db.get_user_xp(GUILD + 1, 1)) == 3
+  assert [e.xp for e in asyncio.run(db.top_users(GUILD + 1, 10))] == [3]
+
+
+def test_period_buckets(backend: StorageBackend):
+  day = xp_day() - 6
+  backend.bulk_add_xp({(GUILD, 1): ('alice', 10), (GUILD, 2): ('bob', 5)}, day=day)
+  backend.bulk_add_xp({(GUILD, 2): ('bob', 20)}, day=day + 5)
+  backend.add_xp_to_user(GUILD, 3, 'carol', 7, day=day + 6)
+  backend.bulk_add_xp({(GUILD, 4): ('dave', 50)}, day=day - 60) # already compacted : lifetime XP only
+  assert [(e.id, e.xp) for e in backend.period_users(GUILD, day)] == [(2, 25), (1, 10), (3, 7)]
+  assert [(e.id, e.xp) for e in backend.period_users(GUILD, day + 1)] == [(2, 20), (3, 7)]
+
+  backend.compact_days(day + 1)
+  assert [(e.id, e.xp) for e in backend.period_users(GUILD, 0)] == [(2, 20), (3, 7)]
+  assert backend.get_user_xp(GUILD, 1) == 10 and backend.get_user_xp(GUILD, 4) == 50
+
+
+def test_mongo_test_raises_on_a_failed_ping(monkeypatch):
+  admin = SimpleNamespace(command=lambda _: {'ok': 0})
+  monkeypatch.setattr(MongoBackend, 'client', SimpleNamespace(admin=admin))
+  with pytest.raises(PyMongoError):
+    MongoBackend('mongodb://localhost:27017').test()
+
+
+def test_sqlite_test_raises_on_a_wrong_answer(monkeypatch):
+  backend = SqliteBackend(':memory:')
+  backend.connect()
+  backend.test()
+  monkeypatch.setattr(backend, '_SqliteBackend__execute', lambda *_: [])
+  with pytest.raises(sqlite3.DatabaseError):
+    backend.test()
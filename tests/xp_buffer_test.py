@@ -0,0 +1,57 @@
+import asyncio
+
+from src.db import SqliteBackend, UsefulDatabase, XpBuffer
+
+GUILD = 3
+
+
+def test_idle_totals_are_evicted_and_seeded_again():
+  db = UsefulDatabase(SqliteBackend(':memory:'), workers=1)
+  db.connect()
+  buffer = XpBuffer(db, max_pending=100, max_totals=2, totals_ttl=3600)
+
+  async def scenario() -> list[int]:
+    olds = [await buffer.add(GUILD, user_id, '', 10) for user_id in (1, 2, 3)]
+    olds.append(await buffer.add(GUILD, 1, '', 5))      # pending, kept in memory
+    assert buffer.evict() == 1 and buffer.n_totals == 2 # user 2, the least recent without pending XP
+    await buffer.flush()
+    olds.append(await buffer.add(GUILD, 2, '', 1))      # seeded again from the atomic upsert
+    return olds
+
+  assert asyncio.run(scenario()) == [0, 0, 0, 10, 10]
+  assert db.backend.get_user_xp(GUILD, 1) == 15 and db.backend.get_user_xp(GUILD, 2) == 11
+
+
+def test_increments_wait_while_paused():
+  db = UsefulDatabase(SqliteBackend(':memory:'), workers=1)
+  db.connect()
+  buffer = XpBuffer(db, max_pending=100)
+
+  async def scenario() -> int:
+    await buffer.add(GUILD, 1, '', 10)
+    await buffer.add(GUILD, 1, '', 5)                   # pending
+    async with buffer.paused():
+      assert buffer.n_pending == 0 and db.backend.get_user_xp(GUILD, 1) == 15
+      late = asyncio.create_task(buffer.add(GUILD, 1, '', 1))
+      await asyncio.sleep(0.01)
+      assert not late.done()
+      db.backend.bulk_add_xp({(GUILD, 1): ('', 100)}) # the stored XP is rewritten
+    return await late
+
+  assert asyncio.run(scenario()) == 115 # read again after the pause
+
+
+def test_lookups_see_the_buffered_increments():
+  db = UsefulDatabase(SqliteBackend(':memory:'), workers=1)
+  db.connect()
+  buffer = XpBuffer(db, max_pending=100)
+
+  async def scenario() -> list[int]:
+    await buffer.add(GUILD, 1, 'a', 10)
+    await buffer.add(GUILD, 1, 'a', 50) # buffered
+    seen = [await db.get_user_xp(GUILD, 1), (await db.user_rank(GUILD, 1)).xp]
+    await buffer.flush()
+    await buffer.add_many({(GUILD, 1): ('a', 5)})
+    return seen + [await db.get_user_xp(GUILD, 1)]
+
+  assert asyncio.run(scenario()) == [60, 60, 65]
@@ -0,0 +1,21 @@
+from src.core.xp_throttle import XpThrottle
+
+
+def test_throttle_scales_spam_down():
+  throttle = XpThrottle(burst=3, rate=0.5)
+  assert [throttle.scale(1, 1, 10, now=0.0) for _ in range(3)] == [10, 10, 10]
+  assert throttle.scale(1, 1, 10, now=0.0) == 0  # bucket empty
+  assert throttle.scale(1, 1, 10, now=1.0) == 5  # half a token refilled
+  assert throttle.scale(1, 2, 10, now=1.0) == 10 # other members are not affected
+  assert throttle.scale(2, 1, 10, now=1.0) == 10 # nor the same member in another guild
+
+
+def test_throttle_evicts_idle_buckets():
+  throttle = XpThrottle(burst=2, rate=1)
+  for user_id in range(100):
+    throttle.scale(1, user_id, 10, now=0.0)
+  throttle.scale(1, 0, 10, now=1.5)
+  assert throttle.evict_idle(now=2.0) == 99
+  assert len(throttle) == 1
+  throttle.scale(1, 1, 10, now=2.0) # reuses a freed slot
+  assert len(throttle) == 2